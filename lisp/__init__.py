@@ -0,0 +1,16 @@
+"""Flask-free lisp interpreter shared by the /lisp-parser routes and the batch CLI."""
+
+from lisp.engine import (
+    ENGINES,
+    EXPRESSION_CACHE,
+    BudgetExceeded,
+    Environment,
+    Profiler,
+    compile_expression,
+    evaluateAll,
+    evaluate_program,
+    execute,
+    iter_evaluate,
+    parse_expression,
+)
+from lisp.sessions import Session, SessionStore
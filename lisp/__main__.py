@@ -0,0 +1,3 @@
+from lisp.cli import main
+
+main()
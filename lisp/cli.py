@@ -0,0 +1,94 @@
+"""Evaluate JSONL files of lisp programs without starting the web app.
+
+Each input line is a JSON list of expressions, or an object with an
+"expressions" list whose other fields (e.g. an id) are copied to its result.
+One JSON result per program is written in input order as soon as it is ready:
+
+    python -m lisp programs.jsonl -o results.jsonl --engine vm --workers 8
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from multiprocessing import Pool
+
+from lisp.engine import ENGINES, evaluate_program
+
+logger = logging.getLogger(__name__)
+
+def evaluate_line(job):
+    """Decode, evaluate and encode one input line; runs inside pool workers."""
+    raw, engine, max_steps, time_limit = job
+    try:
+        program = json.loads(raw)
+    except ValueError as e:
+        return json.dumps({"output": [], "error": f"Invalid JSON: {e}"})
+
+    extra = {}
+    if isinstance(program, dict):
+        extra = {key: value for key, value in program.items() if key != "expressions"}
+        program = program.get("expressions")
+    if not isinstance(program, list):
+        return json.dumps({**extra, "output": [], "error": "Expected a list of expressions"})
+
+    result = evaluate_program((program, engine, max_steps, time_limit))
+    return json.dumps({**extra, **result})
+
+def read_jobs(paths, engine, max_steps, time_limit):
+    for path in paths:
+        source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for raw in source:
+                if raw.strip():
+                    yield raw, engine, max_steps, time_limit
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+def run(jobs, out, workers, chunksize):
+    """Write one result line per job, in order; returns the number of programs."""
+    count = 0
+    if workers <= 1:
+        for count, line in enumerate(map(evaluate_line, jobs), start=1):
+            out.write(line + "\n")
+        return count
+
+    # Pool.imap would queue the whole input up front, so feed it bounded windows
+    window = workers * chunksize * 4
+    with Pool(workers) as pool:
+        while True:
+            batch = list(itertools.islice(jobs, window))
+            if not batch:
+                return count
+            for line in pool.imap(evaluate_line, batch, chunksize):
+                out.write(line + "\n")
+                count += 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lisp", description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="JSONL files of programs, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Where to write JSONL results (default: stdout)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="tree")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; 0 means one per CPU")
+    parser.add_argument("--chunksize", type=int, default=256, help="Programs sent to a worker at a time")
+    parser.add_argument("--max-steps", type=int, default=None, help="Step budget per program")
+    parser.add_argument("--time-limit", type=float, default=None, help="Seconds allowed per program")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count()
+    jobs = read_jobs(args.inputs, args.engine, args.max_steps, args.time_limit)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    start = time.perf_counter()
+    try:
+        count = run(jobs, out, workers, args.chunksize)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} programs in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s)", file=sys.stderr)
@@ -0,0 +1,800 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from collections import defaultdict, namedtuple, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Syntax tree nodes. A program line is parsed once into these and then walked,
+# instead of re-splitting the source text at every nested call.
+Literal = namedtuple("Literal", ["value"])
+Symbol = namedtuple("Symbol", ["name"])
+Call = namedtuple("Call", ["function", "args"])
+# A pure call that refers to variables. Variables can never be reassigned, so
+# its value is remembered per program under its source text.
+Memo = namedtuple("Memo", ["key", "node"])
+
+# Compiled form of a line for the stack VM. `names` lists the variables the
+# line refers to; instruction operands index into it.
+Code = namedtuple("Code", ["instructions", "names"])
+
+# VM opcodes
+LOAD_CONST, LOAD_NAME, CHECK_UNSET, STORE_NAME, CALL, PUTS, MEMO = range(7)
+
+# How a parsed node can be optimized, as seen by its parent call
+CONSTANT, VARIABLE, PURE, IMPURE = range(4)
+
+UNBOUND = object()  # Marks a slot that has been allocated but never set
+
+BUDGET_CHECK_INTERVAL = 1024  # Steps between clock reads when a deadline is set
+
+# Longest string a builtin may build, so a few lines cannot exhaust memory
+MAX_STRING_LENGTH = int(os.environ.get("LISP_MAX_STRING_LENGTH", 16 * 1024 * 1024))
+# Largest integer, in bits, arithmetic may build, so repeated multiplication cannot run unbounded
+MAX_NUMBER_BITS = int(os.environ.get("LISP_MAX_NUMBER_BITS", 64 * 1024))
+
+class BudgetExceeded(Exception):
+    pass
+
+# One token per match: "(", ")", a quoted string or a bare atom
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|("[^"]*")|([^\s()"]+))')
+TRAILING_SPACE = re.compile(r'\s*')
+
+# Plain numeric literals, e.g. 7, -0.50 or +5. Other atoms float() accepts, such
+# as 1e5, are floats too unless they start with a letter, like inf or nan
+NUMBER_PATTERN = re.compile(r'[-+]?(?:\d+(?:\.\d*)?|\.\d+)')
+
+def is_number(expression):
+    return NUMBER_PATTERN.fullmatch(expression) is not None
+
+def parses_as_float(expression):
+    try:
+        float(expression)
+        return True
+    except ValueError:
+        return False
+
+def tokenize(exp):
+    """Split a line into (kind, text, end offset) tokens in a single left-to-right scan."""
+    tokens = []
+    pos = 0
+    end = TRAILING_SPACE.match(exp, pos).end()
+    while end < len(exp):
+        match = TOKEN_PATTERN.match(exp, pos)
+        if match is None:
+            raise SyntaxError(f"Unexpected character at {pos}")
+        pos = match.end()
+        if match.group(1):
+            tokens.append(("(", "(", pos))
+        elif match.group(2):
+            tokens.append((")", ")", pos))
+        elif match.group(3):
+            tokens.append(("string", match.group(3), pos))
+        else:
+            tokens.append(("atom", match.group(4), pos))
+        end = TRAILING_SPACE.match(exp, pos).end()
+    return tokens
+
+# Atoms that are literals rather than variable names
+KEYWORDS = {"true": True, "false": False, "null": None}
+
+class SourceInt(int):
+    """An int literal that prints the way it was written (e.g. "007")."""
+
+    def __str__(self):
+        return self.text
+
+class SourceFloat(float):
+    """A float literal that prints the way it was written (e.g. "1.50")."""
+
+    def __str__(self):
+        return self.text
+
+def make_number(text):
+    number_type, source_type = (int, SourceInt) if text.lstrip("+-").isdigit() else (float, SourceFloat)
+    number = number_type(text)
+    if str(number) == text:
+        return number
+    # Arithmetic on these yields plain numbers; only `str` sees the source text
+    number = source_type(text)
+    number.text = text
+    return number
+
+def make_atom(text):
+    if text in KEYWORDS:
+        return Literal(KEYWORDS[text])
+    if is_number(text):
+        return Literal(make_number(text))
+    if not text[0].isalpha() and parses_as_float(text):
+        return Literal(make_number(text))  # e.g. 1e5, which `str` still prints as written
+    return Symbol(text)
+
+def memoize(node, kind_span, exp):
+    """Wrap a pure call so its value is remembered under its source text."""
+    kind, start, end = kind_span
+    if kind == PURE:
+        return Memo(exp[start:end], node)
+    return node
+
+def optimize_call(function, args, kinds, exp):
+    """Build a Call node, folding it into a Literal when it only has constant inputs.
+
+    `kinds` holds a (kind, start, end) entry per argument. Returns the node
+    and its own kind. Pure subtrees are left unwrapped until an impure parent
+    (or the top of the line) shows they are maximal, then become Memo nodes.
+    """
+    builtin = BUILTINS.get(function)
+    if builtin is not None:
+        if all(kind[0] == CONSTANT for kind in kinds):
+            try:
+                return Literal(builtin(*[arg.value for arg in args])), CONSTANT
+            except Exception:
+                pass  # Left for evaluation so the error is reported on its own line
+        if all(kind[0] != IMPURE for kind in kinds):
+            return Call(function, tuple(args)), PURE
+
+    args = tuple(memoize(arg, kind_span, exp) for arg, kind_span in zip(args, kinds))
+    return Call(function, args), IMPURE
+
+def parse_expression(exp):
+    """Parse one line into a tree of Literal/Symbol/Call/Memo nodes.
+
+    Uses an explicit stack rather than recursion so arbitrarily deep nesting
+    is parsed in one linear pass. Calls are optimized as they close: pure
+    builtins over constants are folded to literals, and maximal pure calls
+    over variables are wrapped in Memo nodes.
+    """
+    stack = []  # (start offset, nodes, kinds) of the calls that are still open
+    root = None
+
+    for kind, text, end in tokenize(exp):
+        start = end - len(text)
+        if kind == "(":
+            stack.append((start, [], []))
+            continue
+        if kind == ")":
+            if not stack:
+                raise SyntaxError("Unbalanced ')'")
+            start, items, kinds = stack.pop()
+            if not items or type(items[0]) is not Symbol:
+                raise SyntaxError("Call without a function name")
+            node, node_kind = optimize_call(items[0].name, items[1:], kinds[1:], exp)
+        elif kind == "string":
+            node, node_kind = Literal(text[1:-1]), CONSTANT
+        else:
+            node = make_atom(text)
+            node_kind = CONSTANT if type(node) is Literal else VARIABLE
+
+        if stack:
+            stack[-1][1].append(node)
+            stack[-1][2].append((node_kind, start, end))
+        elif root is None:
+            root = memoize(node, (node_kind, start, end), exp)
+        else:
+            raise SyntaxError("More than one expression on a line")
+
+    if stack or root is None:
+        raise SyntaxError("Unbalanced '('")
+    return root
+
+def get_string(value):
+    if type(value) is str:
+        return value
+    raise ValueError(f"Not a string: {format_value(value)}")
+
+def is_number_value(value):
+    value_type = type(value)
+    if value_type is int or value_type is float:
+        return True
+    return value_type is not bool and isinstance(value, (int, float))
+
+def get_number(value):
+    value_type = type(value)
+    if value_type is int or value_type is float:
+        return value
+    if is_number_value(value):
+        # Drop the source text of a literal so results print canonically
+        return float(value) if isinstance(value, float) else int(value)
+    raise ValueError(f"Not a number: {format_value(value)}")
+
+def format_value(value):
+    """Render a value in the interpreter's textual form."""
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if type(value) is str:
+        return value
+    text = str(value)
+    if isinstance(value, float) and "." in text:
+        idx = text.find(".")
+        return text[:idx + 5]  # Keep at most 4 decimal places
+    return text
+
+def check_length(length):
+    if length > MAX_STRING_LENGTH:
+        raise ValueError(f"String longer than {MAX_STRING_LENGTH} characters")
+
+def concat(arg1, arg2):
+    arg1, arg2 = get_string(arg1), get_string(arg2)
+    check_length(len(arg1) + len(arg2))
+    return arg1 + arg2
+
+def lowercase(arg1):
+    result = get_string(arg1).lower()
+    check_length(len(result))
+    return result
+
+def uppercase(arg1):
+    result = get_string(arg1).upper()  # Can grow, e.g. "ß" becomes "SS"
+    check_length(len(result))
+    return result
+
+def stri(arg1):
+    return format_value(arg1)
+
+def check_bits(bits):
+    if bits > MAX_NUMBER_BITS:
+        raise ValueError(f"Number larger than {MAX_NUMBER_BITS} bits")
+
+def check_size(number):
+    if type(number) is int:
+        check_bits(number.bit_length())
+    return number
+
+def add(*args):
+    if len(args) < 2:
+        raise Exception("Addition requires more than one argument")
+
+    total_sum = 0  # Stays an int unless a float is added
+    for arg in args:
+        total_sum = check_size(total_sum + get_number(arg))
+    return total_sum
+
+def multiply(*args):
+    if len(args) < 2:
+        raise Exception("Multiplication requires more than one argument")
+
+    product = 1
+    for arg in args:
+        value = get_number(arg)
+        if type(product) is int and type(value) is int:
+            # Checked before multiplying, since one huge product can take minutes
+            check_bits(product.bit_length() + value.bit_length() - 1)
+        product *= value
+    return check_size(product)
+
+def subtract(arg1, arg2):
+    return check_size(get_number(arg1) - get_number(arg2))
+
+def divide(arg1, arg2):
+    return get_number(arg1) / get_number(arg2)
+
+def mini(*args):
+    if not args:
+        raise Exception("min requires at least one argument")
+
+    mini = float('inf')
+    for arg in args:
+        mini = min(mini, get_number(arg))
+    return mini
+
+def maxi(*args):
+    if not args:
+        raise Exception("max requires at least one argument")
+
+    maxi = float('-inf')
+    for arg in args:
+        maxi = max(maxi, get_number(arg))
+    return maxi
+
+def abso(arg1):
+    return abs(get_number(arg1))
+
+def gt(arg1, arg2):
+    return get_number(arg1) > get_number(arg2)
+
+def lt(arg1, arg2):
+    return get_number(arg1) < get_number(arg2)
+
+def replace(source, target, replacement):
+    # Replace all occurrences of the target in the source
+    source, target, replacement = get_string(source), get_string(target), get_string(replacement)
+    # An empty target matches between every character, so check the size before building it
+    matches = source.count(target)
+    check_length(len(source) + matches * (len(replacement) - len(target)))
+    return source.replace(target, replacement)
+
+def substring(source, start, end):
+    source = get_string(source)
+    start = get_number(start)
+    end = get_number(end)
+    # Ensure valid range
+    if start < 0 or end < 0 or start > end or end >= len(source):
+        raise ValueError("Invalid start or end index.")
+
+    return source[start:end]
+
+def equal(arg1, arg2):
+    if is_number_value(arg1) and is_number_value(arg2):
+        return arg1 == arg2
+    if type(arg1) is type(arg2):
+        return arg1 == arg2
+    return False
+
+def not_equal(arg1, arg2):
+    return not equal(arg1, arg2)
+
+# Functions whose arguments are all evaluated before the call
+BUILTINS = {
+    "concat": concat,
+    "uppercase": uppercase,
+    "lowercase": lowercase,
+    "str": stri,
+    "add": add,
+    "multiply": multiply,
+    "subtract": subtract,
+    "divide": divide,
+    "replace": replace,
+    "substring": substring,
+    "max": maxi,
+    "min": mini,
+    "abs": abso,
+    "gt": gt,
+    "lt": lt,
+    "equal": equal,
+    "not_equal": not_equal,
+}
+
+def puts(args, environment, output):
+    value, = args
+    output.append(get_string(evaluate(value, environment, output)))
+    return None
+
+def sets(args, environment, output):
+    name, value = args
+    variables = environment.variables
+    if type(name) is not Symbol or name.name in variables:
+        raise Exception(f"Cannot set {name}")
+
+    value = variables[name.name] = evaluate(value, environment, output)
+    environment.size += sys.getsizeof(value)
+    return None
+
+# Forms that need the unevaluated arguments or the output list
+SPECIAL_FORMS = {
+    "puts": puts,
+    "set": sets,
+}
+
+def evaluate(node, environment, output):
+    """Evaluate a parsed node to a native value (str, int, float, bool or None)."""
+    node_type = type(node)
+    if node_type is Literal:
+        return node.value
+    if node_type is Symbol:
+        return environment.variables[node.name]
+    if node_type is Memo:
+        memo = environment.memo
+        if node.key not in memo:
+            value = memo[node.key] = evaluate(node.node, environment, output)
+            environment.size += sys.getsizeof(value)
+        return memo[node.key]
+
+    environment.steps += 1
+    if environment.steps > environment.next_check:
+        environment.check_budget()
+
+    special = environment.special_forms.get(node.function)
+    if special is not None:
+        return special(node.args, environment, output)
+    function = environment.builtins[node.function]
+    return function(*[evaluate(arg, environment, output) for arg in node.args])
+
+class Profiler:
+    """Opt-in instrumentation for one request.
+
+    Counts calls and total/self time per builtin and special form, plus the
+    parse and compile phases, and tracks the deepest call nesting and the
+    longest string seen. Environments without a profiler keep using the
+    plain function tables, so the disabled path is unchanged.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.total_time = defaultdict(float)
+        self.self_time = defaultdict(float)
+        self.child_time = [0.0]  # Time spent in nested profiled calls, per open call
+        self.max_depth = 0
+        self.peak_string = 0
+        self.wrappers = {}  # Original function -> profiled wrapper
+        self.builtins = {name: self.wrap(name, function) for name, function in BUILTINS.items()}
+        self.special_forms = {name: self.wrap(name, function) for name, function in SPECIAL_FORMS.items()}
+
+    def wrap(self, name, function):
+        def profiled(*args):
+            return self.call(name, function, args)
+        self.wrappers[function] = profiled
+        return profiled
+
+    def call(self, name, function, args):
+        self.child_time.append(0.0)
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.child_time.pop()
+            self.child_time[-1] += elapsed
+            self.calls[name] += 1
+            self.total_time[name] += elapsed
+            self.self_time[name] += elapsed - children
+        if type(result) is str and len(result) > self.peak_string:
+            self.peak_string = len(result)
+        return result
+
+    def observe_tree(self, root):
+        """Record the call nesting depth and string literal sizes of a parsed line."""
+        pending = [(root, 0)]
+        while pending:
+            node, depth = pending.pop()
+            node_type = type(node)
+            if node_type is Memo:
+                pending.append((node.node, depth))
+            elif node_type is Call:
+                self.max_depth = max(self.max_depth, depth + 1)
+                pending.extend((arg, depth + 1) for arg in node.args)
+            elif node_type is Literal and type(node.value) is str:
+                self.peak_string = max(self.peak_string, len(node.value))
+
+    def report(self):
+        names = sorted(self.calls, key=lambda name: self.total_time[name], reverse=True)
+        return {
+            "functions": {
+                name: {
+                    "calls": self.calls[name],
+                    "totalMs": round(self.total_time[name] * 1000, 3),
+                    "selfMs": round(self.self_time[name] * 1000, 3),
+                }
+                for name in names
+            },
+            "maxDepth": self.max_depth,
+            "peakStringLength": self.peak_string,
+        }
+
+class Environment:
+    """State of one program: its variables and memoized pure calls.
+
+    The tree walker keeps variables by name. The VM keeps them in slots: every
+    distinct name gets a slot index the first time a compiled line that
+    mentions it is linked, so instructions read and write a list instead of
+    hashing names on every lookup.
+
+    Every call evaluated counts as a step. With max_steps or a deadline (a
+    time.monotonic() value) set, running over raises BudgetExceeded; the
+    engines only pay for a counter increment until next_check is reached.
+    """
+
+    def __init__(self, max_steps=None, deadline=None, profiler=None):
+        self.profiler = profiler
+        # Function tables the engines call through, swapped for profiled ones when profiling
+        self.builtins = profiler.builtins if profiler else BUILTINS
+        self.special_forms = profiler.special_forms if profiler else SPECIAL_FORMS
+        self.dispatch = PROFILED_DISPATCH if profiler else DISPATCH
+        self.variables = {}  # Name -> value, for the tree walker
+        self.slots = {}  # Name -> index into values, for the VM
+        self.values = []
+        self.memo = {}  # Memo key -> value
+        self.size = 0  # Approximate bytes held by variables and memoized values
+        self.error_line = None  # Line that stopped the program, if any
+        self.steps = 0
+        self.max_steps = max_steps
+        self.deadline = deadline
+        self.exceeded = None  # Which budget ran out, if any
+        self.next_check = float('inf')
+        self.schedule_check()
+
+    def schedule_check(self):
+        if self.deadline is not None:
+            self.next_check = self.steps + BUDGET_CHECK_INTERVAL
+        if self.max_steps is not None:
+            self.next_check = min(self.next_check, self.max_steps)
+
+    def check_budget(self):
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.exceeded = "step budget exceeded"
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = "time budget exceeded"
+        if self.exceeded:
+            raise BudgetExceeded(self.exceeded)
+        self.schedule_check()
+
+    def link(self, names):
+        """Resolve a line's local name table to slot indices."""
+        slots = []
+        for name in names:
+            index = self.slots.get(name)
+            if index is None:
+                index = len(self.values)
+                self.slots[name] = index
+                self.values.append(UNBOUND)
+            slots.append(index)
+        return slots
+
+def compile_expression(node):
+    """Compile a parsed line to a flat instruction list for `execute`.
+
+    The tree is walked with an explicit stack in post-order, so deep nesting
+    never recurses.
+    """
+    instructions = []
+    names = []
+    name_index = {}
+
+    def local(name):
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+        return name_index[name]
+
+    pending = [(node, False)]
+    while pending:
+        node, ready = pending.pop()
+        node_type = type(node)
+        if node_type is Literal:
+            instructions.append((LOAD_CONST, node.value))
+            continue
+        if node_type is Symbol:
+            instructions.append((LOAD_NAME, local(node.name)))
+            continue
+        if node_type is Memo:
+            instructions.append((MEMO, (node.key, compile_expression(node.node))))
+            continue
+
+        function = node.function
+        if ready:
+            if function == "set":
+                instructions.append((STORE_NAME, local(node.args[0].name)))
+            elif function == "puts":
+                instructions.append((PUTS, None))
+            else:
+                instructions.append((CALL, (BUILTINS[function], len(node.args))))
+            continue
+
+        # Check the call shape up front, then queue the arguments that need evaluating
+        if function == "set":
+            if len(node.args) != 2 or type(node.args[0]) is not Symbol:
+                raise SyntaxError("set takes a name and a value")
+            args = node.args[1:]
+        elif function == "puts":
+            if len(node.args) != 1:
+                raise SyntaxError("puts takes one argument")
+            args = node.args
+        elif function in BUILTINS:
+            args = node.args
+        else:
+            raise NameError(f"Unknown function {function}")
+
+        pending.append((node, True))
+        for arg in reversed(args):
+            pending.append((arg, False))
+        if function == "set":
+            # Redefinition is an error before the value is evaluated
+            instructions.append((CHECK_UNSET, local(node.args[0].name)))
+
+    return Code(tuple(instructions), tuple(names))
+
+def op_load_const(stack, operand, environment, slots, output):
+    stack.append(operand)
+
+def op_load_name(stack, operand, environment, slots, output):
+    value = environment.values[slots[operand]]
+    if value is UNBOUND:
+        raise NameError("Variable is not set")
+    stack.append(value)
+
+def op_check_unset(stack, operand, environment, slots, output):
+    if environment.values[slots[operand]] is not UNBOUND:
+        raise Exception("Variable is already set")
+
+def op_store_name(stack, operand, environment, slots, output):
+    count_step(environment)
+    environment.values[slots[operand]] = stack[-1]
+    environment.size += sys.getsizeof(stack[-1])
+    stack[-1] = None
+
+def count_step(environment):
+    environment.steps += 1
+    if environment.steps > environment.next_check:
+        environment.check_budget()
+
+def op_call(stack, operand, environment, slots, output):
+    count_step(environment)
+    function, argc = operand
+    split = len(stack) - argc
+    result = function(*stack[split:])
+    del stack[split:]
+    stack.append(result)
+
+def op_puts(stack, operand, environment, slots, output):
+    count_step(environment)
+    output.append(get_string(stack[-1]))
+    stack[-1] = None
+
+def op_memo(stack, operand, environment, slots, output):
+    key, code = operand
+    memo = environment.memo
+    if key not in memo:
+        value = memo[key] = execute(code, environment, output)
+        environment.size += sys.getsizeof(value)
+    stack.append(memo[key])
+
+# Indexed by opcode
+DISPATCH = (op_load_const, op_load_name, op_check_unset, op_store_name, op_call, op_puts, op_memo)
+
+def op_store_name_profiled(stack, operand, environment, slots, output):
+    environment.profiler.call("set", op_store_name, (stack, operand, environment, slots, output))
+
+def op_call_profiled(stack, operand, environment, slots, output):
+    function, argc = operand
+    op_call(stack, (environment.profiler.wrappers[function], argc), environment, slots, output)
+
+def op_puts_profiled(stack, operand, environment, slots, output):
+    environment.profiler.call("puts", op_puts, (stack, operand, environment, slots, output))
+
+PROFILED_DISPATCH = (op_load_const, op_load_name, op_check_unset, op_store_name_profiled,
+                     op_call_profiled, op_puts_profiled, op_memo)
+
+def execute(code, environment, output):
+    """Run compiled code against an Environment and return the line's value."""
+    stack = []
+    dispatch = environment.dispatch
+    slots = environment.link(code.names)
+    for opcode, operand in code.instructions:
+        dispatch[opcode](stack, operand, environment, slots, output)
+    return stack.pop()
+
+class LRUCache:
+    """Bounded, thread-safe mapping that evicts the least recently used entry.
+
+    Each gunicorn worker process holds its own instance; the lock only guards
+    against the threads of one process.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key, create):
+        """Return the cached value for key, building it with create() on a miss.
+
+        create() runs outside the lock so a slow build does not block other
+        threads; if it raises, nothing is cached.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = create()
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+# Parsed and compiled lines shared across requests, keyed on (form, line text).
+# Nodes and Code objects are immutable tuples, so entries can be shared freely.
+EXPRESSION_CACHE = LRUCache(int(os.environ.get("LISP_CACHE_SIZE", 4096)))
+
+def load_tree(exp):
+    return EXPRESSION_CACHE.get_or_create(("tree", exp), lambda: parse_expression(exp))
+
+def load_code(exp):
+    return EXPRESSION_CACHE.get_or_create(("vm", exp), lambda: compile_expression(load_tree(exp)))
+
+def run_tree(exp, environment, output):
+    return evaluate(load_tree(exp), environment, output)
+
+def run_vm(exp, environment, output):
+    return execute(load_code(exp), environment, output)
+
+def run_tree_profiled(exp, environment, output):
+    profiler = environment.profiler
+    node = profiler.call("parse", load_tree, (exp,))
+    profiler.observe_tree(node)
+    return evaluate(node, environment, output)
+
+def run_vm_profiled(exp, environment, output):
+    profiler = environment.profiler
+    profiler.observe_tree(profiler.call("parse", load_tree, (exp,)))
+    code = profiler.call("compile", load_code, (exp,))
+    return execute(code, environment, output)
+
+# Selectable evaluation engines, each a line runner
+ENGINES = {
+    "tree": run_tree,
+    "vm": run_vm,
+}
+
+PROFILED_ENGINES = {
+    "tree": run_tree_profiled,
+    "vm": run_vm_profiled,
+}
+
+def iter_evaluate(expressions, engine="tree", environment=None, first_line=1):
+    """Evaluate lines one at a time, yielding each output line as soon as its line has run.
+
+    expressions may be any iterable, including one that is still being read,
+    so neither the program nor its output has to be held in memory.
+    """
+    if environment is None:
+        environment = Environment()
+    run_line = (PROFILED_ENGINES if environment.profiler else ENGINES)[engine]
+    output = []
+
+    for line_number, exp in enumerate(expressions, start=first_line):
+        try:
+            # Slow builtins can use up a deadline in fewer steps than
+            # BUDGET_CHECK_INTERVAL, so budgets are also checked every line
+            environment.check_budget()
+            run_line(exp, environment, output)
+        except Exception as e:
+            output.append(f"ERROR at line {line_number}")
+            environment.error_line = line_number
+            yield from output
+            return
+        yield from output
+        output.clear()
+
+def evaluateAll(expressions, engine="tree", environment=None, first_line=1):
+    return list(iter_evaluate(expressions, engine, environment, first_line))
+
+def evaluate_program(program):
+    """Evaluate one (expressions, engine, max_steps, time_limit) job under its own budgets.
+
+    Meant for pool workers: it never raises, so one bad program cannot fail
+    the rest of a batch. Budgets of None are unlimited.
+    """
+    expressions, engine, max_steps, time_limit = program
+    try:
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        environment = Environment(max_steps, deadline)
+        output = evaluateAll(expressions, engine, environment)
+    except Exception as e:
+        return {"output": [], "error": str(e)}
+
+    result = {"output": output}
+    if environment.exceeded:
+        result["error"] = environment.exceeded
+    return result
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+from lisp.engine import Environment, evaluateAll
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """A program that grows over several requests, keeping its Environment."""
+
+    def __init__(self, engine):
+        self.id = uuid.uuid4().hex
+        self.engine = engine
+        self.environment = Environment()
+        self.lines = 0  # Lines received so far
+        self.lock = threading.Lock()  # Serializes requests for the same session
+        self.last_used = time.monotonic()
+
+    def run(self, expressions):
+        """Evaluate only the new lines and return their output.
+
+        Like a full re-run, nothing after an error line is evaluated, so a
+        session that hit an error produces no further output.
+        """
+        if not isinstance(expressions, list):
+            raise TypeError("expressions must be a list")
+        with self.lock:
+            output = []
+            if self.environment.error_line is None:
+                output = evaluateAll(expressions, self.engine, self.environment, self.lines + 1)
+            self.lines += len(expressions)
+            self.last_used = time.monotonic()
+        return output
+
+class SessionStore:
+    """In-memory sessions with an idle TTL and a cap on the memory they hold.
+
+    Sessions live in one process, so behind several gunicorn workers clients
+    need sticky routing. When the cap is exceeded the least recently used
+    sessions are dropped first.
+    """
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()  # Id -> Session, least recently used first
+        self.lock = threading.Lock()
+
+    def create(self, engine):
+        session = Session(engine)
+        with self.lock:
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            self.expire()
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_used >= cutoff:
+                break
+            self.sessions.popitem(last=False)
+
+    def enforce_limit(self, keep=None):
+        """Drop sessions until they fit under the cap, sparing the session with id keep."""
+        with self.lock:
+            self.expire()
+            total = sum(session.environment.size for session in self.sessions.values())
+            for session_id in list(self.sessions):
+                if total <= self.max_bytes:
+                    break
+                if session_id == keep:
+                    continue
+                session = self.sessions.pop(session_id)
+                total -= session.environment.size
+                logger.info(f"Evicted lisp session {session.id} to stay under the memory cap")
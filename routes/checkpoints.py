@@ -0,0 +1,126 @@
+import logging
+import os
+import pickle
+import threading
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class CheckpointCache:
+    """LRU cache of saved simulation runs, bounded by the memory they hold.
+
+    Entries need a `size` attribute (bytes). When `spill_dir` is set, entries
+    pushed out of memory are pickled there and loaded back on a later miss,
+    which also lets several worker processes share them. The oldest spilled
+    files are deleted once they take more than `disk_bytes`.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None, disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()  # Key -> entry, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spills = 0
+
+    def path(self, key):
+        return os.path.join(self.spill_dir, key + ".pkl")
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self.load(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        evicted = []
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            total = sum(entry.size for entry in self.entries.values())
+            while total > self.max_bytes and self.entries:
+                old_key, old_entry = self.entries.popitem(last=False)
+                total -= old_entry.size
+                evicted.append((old_key, old_entry))
+
+        # Pickling can be slow, so it happens outside the lock
+        for old_key, old_entry in evicted:
+            self.spill(old_key, old_entry)
+
+    def load(self, key):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                entry = pickle.load(f)
+            os.utime(self.path(key))  # Spilled files are trimmed oldest first
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not load checkpoint {key}: {e}")
+            return None
+
+    def spill(self, key, entry):
+        if not self.spill_dir:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # Write then rename, so other processes never read a partial file
+            temporary = self.path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(key))
+        except OSError as e:
+            logger.warning(f"Could not spill checkpoint {key}: {e}")
+            return
+        with self.lock:
+            self.spills += 1
+        self.trim_disk()
+
+    def trim_disk(self):
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Removed by another process
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "bytes": sum(entry.size for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "spills": self.spills,
+            }
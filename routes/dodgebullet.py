@@ -48,54 +48,67 @@ opp_bullet = {
     "d": "u"
 }
 
-# Helper to check if a move is safe
-def is_safe_move(r, c, move, grid, bullets):
-    if 0 <= r < len(grid) and 0 <= c < len(grid[0]):
-        for (br, bc, m) in bullets:
-            # Check if bullet is in the next move position and moving towards the player
-            if r == br and c == bc and opp_bullet[move] == m:
-                return False
-        return True
-    return False
+# Bullet positions at each tick, until every bullet has left the grid
+def bullet_ticks(bullets, grid):
+    ticks = [bullets]
+    while bullets:
+        bullets = move_bullets(bullets, grid)
+        ticks.append(bullets)
+    return ticks
 
-# Helper to check if a bullet will hit the player after its move
-def is_safe_after_bullet_move(r, c, bullets):
-    for br, bc, d in bullets:
-        if d == 'u':
-            new_r, new_c = br - 1, bc
-        elif d == 'd':
-            new_r, new_c = br + 1, bc
-        elif d == 'l':
-            new_r, new_c = br, bc - 1
-        elif d == 'r':
-            new_r, new_c = br, bc + 1
-        
-        if (r, c) == (new_r, new_c):
-            return False
-    return True
+# Helper to find the moves bullets make unsafe during one tick. Moving into a
+# cell is unsafe when a bullet there is coming the other way (the two would
+# pass through each other), or when a bullet moves into that cell next.
+def tick_hazards(bullets, grid):
+    head_on = set(bullets)
+    landing = {(r, c) for r, c, _ in move_bullets(bullets, grid)}
+    return head_on, landing
 
-# Recursive DFS to dodge bullets without using a visited set
-def dodge_bullets(grid, player_pos, bullets, instructions):
-    # Base case: if there are no more bullets and the player is safe, return instructions
-    if not bullets:
-        return instructions
+# Iterative DFS over (row, col, tick) states. Bullets move the same way
+# whatever the player does, so a state reached a second time has already
+# failed (ticks only grow along a path) and is skipped. Moves are tried in the
+# same order as a plain recursive search, so the same instructions are found.
+def dodge_bullets(grid, player_pos, bullets):
+    ticks = bullet_ticks(bullets, grid)
+    last_tick = len(ticks) - 1  # The first tick with no bullets left
+    if last_tick == 0:
+        return []
+
+    rows, cols = len(grid), len(grid[0])
+    hazards = [tick_hazards(ticks[tick], grid) for tick in range(last_tick)]
+    start = (player_pos[0], player_pos[1], 0)
+    parent = {start: None}  # State -> (previous state, move); also the visited table
+    stack = [[start, 0]]  # State and index of the next move to try from it
+
+    while stack:
+        frame = stack[-1]
+        (r, c, tick), index = frame
+        if index == len(move_directions):
+            stack.pop()
+            continue
+        frame[1] = index + 1
+
+        dr, dc, move = move_directions[index]
+        new_r, new_c = r + dr, c + dc
+        head_on, landing = hazards[tick]
+        if not (0 <= new_r < rows and 0 <= new_c < cols):
+            continue
+        if (new_r, new_c, opp_bullet[move]) in head_on or (new_r, new_c) in landing:
+            continue
+
+        state = (new_r, new_c, tick + 1)
+        if state in parent:
+            continue
+        parent[state] = ((r, c, tick), move)
+        if tick + 1 == last_tick:
+            # Follow the parent pointers back to the start
+            instructions = []
+            while parent[state] is not None:
+                state, move = parent[state]
+                instructions.append(move)
+            return instructions[::-1]
+        stack.append([state, 0])
 
-    for dr, dc, move in move_directions:
-        new_r = player_pos[0] + dr
-        new_c = player_pos[1] + dc
-        
-        # Check if the move is safe
-        if is_safe_move(new_r, new_c, move, grid, bullets) and is_safe_after_bullet_move(new_r, new_c, bullets):
-            next_bullets = move_bullets(bullets, grid)
-            new_instructions = instructions[:] + [move]
-            
-            # Recur with the new state
-            result = dodge_bullets(grid, (new_r, new_c), next_bullets, new_instructions)
-            
-            # If a valid path is found, return it
-            if result:
-                return result
-    
     # If no valid move found, return None
     return None
 
@@ -105,8 +118,8 @@ def dodge_endpoint():
     map_str = request.data.decode('utf-8')
     grid, player_pos, bullets = parse_map(map_str)
     
-    # Try to find instructions to dodge all bullets using DFS without visited set
-    instructions = dodge_bullets(grid, player_pos, bullets, [])
+    # Try to find instructions to dodge all bullets
+    instructions = dodge_bullets(grid, player_pos, bullets)
     
     # If no valid instructions, return null
     if instructions is None:
@@ -1,393 +1,167 @@
+import json
 import logging
-import re
+import os
 
-from flask import request, jsonify
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import request, jsonify, Response, stream_with_context
+from lisp.engine import ENGINES, EXPRESSION_CACHE, Environment, Profiler, evaluateAll, evaluate_program, iter_evaluate
+from lisp.sessions import SessionStore
 from routes import app
+from routes.pool import get_pool, reset_pool
+from routes.validation import is_positive
 
 logger = logging.getLogger(__name__)
 
-def is_function_invocation(expression):
-    return expression[0] == "(" and expression[-1] == ")"
-
-def find_function_end(arg):
-    """Find the index where the function invocation ends."""
-    if not arg.startswith("("):
-        return -1  # Not a function invocation, no need to find an end
-
-    count = 0  # To track parentheses
-    for i, char in enumerate(arg):
-        if char == "(":
-            count += 1
-        elif char == ")":
-            count -= 1
-            if count == 0:
-                return i + 1  # Return index after the closing parenthesis
-    return -1  # Mismatched parentheses, should raise an error in a real scenario
-
-def find_string_end(arg):
-    """Find the index where the quoted string ends."""
-    pattern = r'\"(.*?)\"'
-    match = re.search(pattern, arg)
-    if match:
-        return match.end()  # Return the position right after the quoted string
-    return -1
-
-def is_string(expression):
-    return expression[:2] == "\"" and expression[-2:] == "\""
-
-def is_bool(expression):
-    return expression == "true" or expression == "false"
-
-def is_number(expression):
-    try:
-        float(expression)
-        return True
-    except ValueError:
-        return False
-    
-def get_string(exp):
-    pattern = r'\"(.*?)\"'
-    return re.findall(pattern, exp)[0]
-
-def puts(arg, variables, output): #done
-    res = arg
-    if is_function_invocation(arg):
-        res = evaluate(arg, variables, output)  
-    elif arg in variables:
-        res = variables[arg]
-        
-    output.append(get_string(res))
-    
-    return "null"
-
-def sets(arg, variables): #done
-    args = arg.split(" ", 1)
-    name = args[0]
-    arg_to_set = args[1]
-    
-    if name in variables:
-        raise Exception()
-
-    #checks func
-    if is_function_invocation(arg_to_set):
-        variables[name] = evaluate(arg_to_set, variables, [])
-    else:
-        variables[name] = arg_to_set
-        
-    return "null"
-
-
-def concat(arg, variables): 
-    args = parse_arguments(arg)
-    arg1 = find_string(args[0], variables)
-    arg2 = find_string(args[1], variables)
-    
-    return "\"" + get_string(arg1) + get_string(arg2) + "\""
-    
-def lowercase(arg1, variables): #done
-    if is_function_invocation(arg1):
-        arg1 = evaluate(arg1, variables, [])
-    elif arg1 in variables:
-        arg1 = variables[arg1]
-        
-    return "\"" + get_string(arg1).lower() + "\""
-
-def uppercase(arg1, variables): #done
-    if is_function_invocation(arg1):
-        arg1 = evaluate(arg1, variables, [])
-    elif arg1 in variables:
-        arg1 = variables[arg1]
-        
-    return "\"" + get_string(arg1).upper() + "\""
-    
-def stri(arg1, variables): #done
-    if is_function_invocation(arg1):
-        arg1 = evaluate(arg1, variables, [])
-    elif arg1 in variables:
-        arg1 = variables[arg1]
-    
-    if arg1.startswith("\""):
-        return arg1
-    else:
-        if "." in arg1:
-            idx = arg1.find(".")
-            return "\"" + arg1[:idx + 5] + "\""
-        return "\"" + arg1 + "\""
-    
-def parse_arguments(arg1):
-    """Custom function to split arguments, respecting function applications and escaped strings."""
-    args = []
-    current_arg = []
-    depth = 0  # To track parentheses
-    inside_string = False  # To track whether we're inside an escaped string
-
-    i = 0
-    while i < len(arg1):
-        char = arg1[i]
-
-        # Toggle the inside_string flag when we encounter an escaped quote (but not in the middle of a function)
-        if char == '\\' and i + 1 < len(arg1) and arg1[i + 1] == '"':
-            inside_string = not inside_string
-            current_arg.append(char)  # Add the backslash to the current_arg
-            current_arg.append(arg1[i + 1])  # Add the quote to the current_arg
-            i += 2
-            continue
-
-        # Handle parentheses for function invocation depth, but only when not inside a string
-        if char == '(' and not inside_string:
-            depth += 1
-        elif char == ')' and not inside_string:
-            depth -= 1
-
-        # Split only when we're outside function invocations and strings
-        if char == ' ' and depth == 0 and not inside_string:
-            if current_arg:
-                args.append(''.join(current_arg).strip())
-                current_arg = []
-        else:
-            current_arg.append(char)
-        
-        i += 1
-
-    # Add the last argument if present
-    if current_arg:
-        args.append(''.join(current_arg).strip())
-
-    return args
+# Batch evaluation defaults, per program
+BATCH_WORKERS = int(os.environ.get("LISP_BATCH_WORKERS", 0))  # 0 means one per CPU
+BATCH_MAX_STEPS = 1_000_000
+BATCH_TIME_LIMIT = 1.0  # Seconds
+BATCH_TIMEOUT_SLACK = 1.0  # Seconds a worker gets past timeLimit before it is killed
 
-def add(arg1, variables): #done
-    args = parse_arguments(arg1)
-    
-    total_sum = 0  # Start with 0, but we will dynamically adjust
-    is_int = True  # Track if all arguments are integers
-    
-    if len(args) == 1:
-        raise Exception("Addition requires more than one argument")
-    
-    for arg in args:
-        value = get_number(arg, variables)
-        
-        is_int = is_int and isinstance(value, int)
-        total_sum += value
-    
-    return str(int(total_sum) if is_int else total_sum)  # Return int or  float
+# Interpreter sessions: idle expiry and the memory held by all sessions together
+SESSION_TTL = float(os.environ.get("LISP_SESSION_TTL", 600))  # Seconds
+SESSION_MAX_BYTES = int(os.environ.get("LISP_SESSION_MAX_BYTES", 64 * 1024 * 1024))
 
+SESSIONS = SessionStore(SESSION_TTL, SESSION_MAX_BYTES)
 
-def mini(arg1, variables): #done
-    args = parse_arguments(arg1)
-    mini = float('inf')
-    for arg in args:
-        mini = min(mini, get_number(arg, variables))
-    return str(mini)  
-
-def maxi(arg1, variables): #done
-    args = parse_arguments(arg1)
-    maxi = float('-inf')
-    for arg in args:
-        maxi = max(maxi, get_number(arg, variables))
-    return str(maxi)
-
-def get_number(arg, variables): #done
-    if is_function_invocation(arg):
-        return get_number(evaluate(arg, variables, []), variables)
-    elif arg in variables:
-        return float(variables[arg]) if "." in variables[arg] else int(variables[arg])
-    else:
-        return float(arg) if "." in arg else int(arg)
-    
-def find_string(arg, variables):
-    if is_function_invocation(arg):
-        return evaluate(arg, variables, [])
-    elif arg in variables:
-        return variables[arg]
-    else:
-        return arg
-
-
-def gt(arg1, variables): #done
-    args = parse_arguments(arg1)
-    arg1 = get_number(args[0], variables)
-    arg2 = get_number(args[1], variables)
-    if arg1 > arg2:
-        return "true"
-    else:
-        return "false"
-
-def lt(arg1, variables): #done
-    args = parse_arguments(arg1)
-    arg1 = get_number(args[0], variables)
-    arg2 = get_number(args[1], variables)
-
-    if arg1 < arg2:
-        return "true"
-    else:
-        return "false"
-
-
-def subtract(arg1, variables): 
-    args = parse_arguments(arg1)
-    arg1 = get_number(args[0], variables)
-    arg2 = get_number(args[1], variables)
-        
-    return str(arg1 - arg2)
-
-def divide(arg1, variables):
-    args = parse_arguments(arg1)
-    if len(args) == 1:
-        raise Exception()
-    arg1 = get_number(args[0], variables)
-    arg2 = get_number(args[1], variables)
-    
-    return str(arg1 / arg2)
-
-def multiply(arg1, variables):
-    args = parse_arguments(arg1)
-    product = 1
-    
-    if len(args) == 1:
-        raise Exception("Addition requires more than one argument")
-    
-    for arg in args:
-        value = get_number(arg, variables)
-        product *= value
-    return str(product)
-
-def replace(arg1, variables):
-    args = parse_arguments(arg1)
-
-    # Simplify each argument to resolve variables and functions
-    source = find_string(args[0], variables)
-    target = get_string(find_string(args[1], variables))
-    replacement = get_string(find_string(args[2], variables))
-
-    # Replace all occurrences of the target in the source
-    result = source.replace(target, replacement)
-
-    return result
-
-
-def substring(arg1, variables):
-    args = parse_arguments(arg1)
-
-    # Simplify each argument: source (string), start (int), end (int)
-    source = get_string(find_string(args[0], variables))
-    start = get_number(args[1], variables)
-    end = get_number(args[2], variables)
-    # Ensure valid range
-    if start < 0 or end < 0 or start > end or end >= len(source):
-        raise ValueError("Invalid start or end index.")
-    
-    # Extract and return the substring
-    result = source[start:end]
-    return "\"" + result + "\""
-
-def abso(arg1, variables):
-    res = get_number(arg1, variables)
-    return str(abs(res))
-
-def equal(arg1, variables):
-    args = parse_arguments(arg1)
-    arg1 = args[0]
-    arg2 = args[1]
-    
-    if is_function_invocation(arg1):
-        arg1 = evaluate(arg1, variables, [])
-    elif arg1 in variables:
-        arg1 = variables[arg1]
-        
-    if is_function_invocation(arg2):
-        arg2 = evaluate(arg2, variables, [])
-    elif arg2 in variables:
-        arg2 = variables[arg2]
-        
-    if arg1 == "null" or arg2 == "null":
-        if arg1 == "null" and arg2 == "null":
-            return "true"
-        else:
-            return "false"
-    try:
-        if get_string(arg1) == get_string(arg2):
-            return "true"
-        else:
-            return "false"
-    except:
-        try:
-            if get_number(arg1) == get_number(arg2):
-                return "true"
-            else: 
-                return "false"
-        except:
-            return "false"
-        
-    
-def not_equal(arg1, variables):
-    value = equal(arg1, variables)
-    if value == "true":
-        return "false"
-    else:
-        return "true"
-
-def evaluate(exp, variables, output):
-    args = exp[1:-1].split(" ", 1)
-    function = args[0]
-    if function == "puts":
-        return puts(args[1], variables, output)
-    elif function == "set":
-        return sets(args[1], variables)
-    elif function == "concat":
-        return concat(args[1], variables)
-    elif function == "uppercase":
-        return uppercase(args[1], variables)
-    elif function == "lowercase":
-        return lowercase(args[1], variables)
-    elif function == "str":
-        return stri(args[1], variables)
-    elif function =="add":
-        return add(args[1], variables)
-    elif function =="multiply":
-        return multiply(args[1], variables)
-    elif function =="subtract":
-        return subtract(args[1], variables)
-    elif function =="divide":
-        return divide(args[1], variables)
-    elif function == "replace":
-        return replace(args[1], variables)
-    elif function == "substring":
-        return substring(args[1], variables)
-    elif function == "max":
-        return maxi(args[1], variables)
-    elif function == "min":
-        return mini(args[1], variables)
-    elif function == "abs":
-        return abso(args[1], variables)
-    elif function == "gt":
-        return gt(args[1], variables)
-    elif function == "lt":
-        return lt(args[1], variables)
-    elif function == "equal":
-        return equal(args[1], variables)
-    elif function == "not_equal":
-        return not_equal(args[1], variables)
-    
-def evaluateAll(expressions):
-    variables = {}
-    output = []
-    
-    print(expressions)
-    
-    for line_number, exp in enumerate(expressions, start=1):
-        try:
-            evaluate(exp, variables, output)
-        except Exception as e:
-            error_message = f"ERROR at line {line_number}"
-            output.append(error_message)
-            return output
-      
-    return output
-    
 @app.route('/lisp-parser', methods=['POST'])
 def parse():
     req = request.json
     expressions = req["expressions"]
-    output = evaluateAll(expressions)
-    return jsonify({"output": output})
+    engine = req.get("engine", "tree")
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine {engine}"}), 400
+
+    if not req.get("profile"):
+        return jsonify({"output": evaluateAll(expressions, engine)})
+
+    environment = Environment(profiler=Profiler())
+    output = evaluateAll(expressions, engine, environment)
+    profile = environment.profiler.report()
+    profile["steps"] = environment.steps
+    return jsonify({"output": output, "profile": profile})
+
+def read_ndjson_lines(stream):
+    """Yield one expression per non-blank line of an NDJSON body as it arrives."""
+    for raw in stream:
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            yield json.loads(raw)
+        except ValueError:
+            yield None  # Reported as an error on its own line
+
+@app.route('/lisp-parser/stream', methods=['POST'])
+def parse_stream():
+    """Streaming variant of /lisp-parser.
+
+    The body is NDJSON with one JSON string expression per line. Output lines,
+    including a final "ERROR at line N", are sent back as {"output": ...}
+    NDJSON chunks as soon as they are produced.
+    """
+    engine = request.args.get("engine", "tree")
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine {engine}"}), 400
+
+    def generate():
+        for line in iter_evaluate(read_ndjson_lines(request.stream), engine):
+            yield json.dumps({"output": line}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def run_batch(jobs, workers, timeout):
+    """Run evaluate_program jobs on the pool and return one result per job, in order.
+
+    A job whose worker failed (e.g. killed for running out of memory) or that
+    is still running after timeout seconds gets an error of its own. An
+    overrunning job's pool is killed and the unfinished jobs resubmitted.
+    """
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    while pending:
+        pool = get_pool("lisp-parser", workers)
+        futures = [(index, pool.submit(evaluate_program, jobs[index])) for index in pending]
+        pending = []
+        broken = killed = False
+        for index, future in futures:
+            if killed:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    results[index] = future.result()
+                else:
+                    pending.append(index)
+                continue
+            try:
+                results[index] = future.result(timeout=timeout)
+            except TimeoutError:
+                logger.error("Error in /lisp-parser/batch: a program overran its time limit")
+                results[index] = {"output": [], "error": "time budget exceeded"}
+                reset_pool("lisp-parser", terminate=True)
+                killed = True
+            except Exception as e:
+                logger.error(f"Error in /lisp-parser/batch: {e}")
+                broken = broken or isinstance(e, BrokenProcessPool)
+                results[index] = {"output": [], "error": str(e) or type(e).__name__}
+        if broken:
+            reset_pool("lisp-parser")
+    return results
+
+@app.route('/lisp-parser/batch', methods=['POST'])
+def parse_batch():
+    req = request.json
+    programs = req.get("programs")
+    engine = req.get("engine", "tree")
+    max_steps = req.get("maxSteps", BATCH_MAX_STEPS)
+    time_limit = req.get("timeLimit", BATCH_TIME_LIMIT)
+
+    if not isinstance(programs, list) or not all(isinstance(program, list) for program in programs):
+        return jsonify({"error": "programs must be a list of expression lists"}), 400
+    if engine not in ENGINES:
+        return jsonify({"error": f"Unknown engine {engine}"}), 400
+    if not is_positive(max_steps) or not is_positive(time_limit):
+        return jsonify({"error": "maxSteps and timeLimit must be positive numbers"}), 400
+
+    workers = BATCH_WORKERS or os.cpu_count()
+    jobs = [(expressions, engine, max_steps, time_limit) for expressions in programs]
+    try:
+        results = run_batch(jobs, workers, time_limit + BATCH_TIMEOUT_SLACK)
+    except Exception as e:
+        logger.error(f"Error in /lisp-parser/batch: {e}")
+        reset_pool("lisp-parser")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"results": results})
+
+@app.route('/lisp-parser/session', methods=['POST'])
+def parse_session():
+    req = request.json
+    expressions = req.get("expressions", [])
+    session_id = req.get("session")
+    if not isinstance(expressions, list):
+        return jsonify({"error": "expressions must be a list"}), 400
+
+    if session_id is None:
+        engine = req.get("engine", "tree")
+        if engine not in ENGINES:
+            return jsonify({"error": f"Unknown engine {engine}"}), 400
+        session = SESSIONS.create(engine)
+    else:
+        session = SESSIONS.get(session_id)
+        if session is None:
+            return jsonify({"error": "Unknown or expired session"}), 404
+
+    output = session.run(expressions)
+    # The session just answered is kept, so the id returned stays usable
+    SESSIONS.enforce_limit(keep=session.id)
+    return jsonify({"session": session.id, "output": output})
+
+@app.route('/lisp-parser/session/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not SESSIONS.delete(session_id):
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify({"session": session_id})
+
+@app.route('/lisp-parser/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(EXPRESSION_CACHE.stats())
@@ -0,0 +1,208 @@
+"""Compiler for lab_work increment rules.
+
+A rule is an integer expression over `count`, e.g. "count * count + 3" or
+"(count - 1) // 2 % 7", with + - * // %, unary minus and parentheses, and
+Python's precedence and floor semantics. Each rule is compiled once into a
+scalar function for single Python ints and a kernel for whole numpy arrays.
+"""
+
+import functools
+import re
+
+from collections import namedtuple
+
+import numpy as np
+
+Const = namedtuple("Const", "value")
+Count = namedtuple("Count", "")
+Neg = namedtuple("Neg", "operand")
+BinOp = namedtuple("BinOp", "op left right")
+
+TOKEN = re.compile(r"\s*(?:(\d+)|(count)\b|(//|[-+*%()]))")
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Invalid increment rule {text!r} at position {position}")
+        number, name, symbol = match.groups()
+        tokens.append(int(number) if number is not None else name or symbol)
+        position = match.end()
+    return tokens
+
+def parse(text):
+    """Parse a rule into a tree of Const, Count, Neg and BinOp nodes."""
+    tokens = tokenize(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def advance():
+        nonlocal position
+        token = peek()
+        position += 1
+        return token
+
+    def expression():
+        node = term()
+        while peek() in ("+", "-"):
+            node = BinOp(advance(), node, term())
+        return node
+
+    def term():
+        node = unary()
+        while peek() in ("*", "//", "%"):
+            node = BinOp(advance(), node, unary())
+        return node
+
+    def unary():
+        # As in Python, unary minus binds tighter than * // %
+        if peek() in ("+", "-"):
+            sign = advance()
+            operand = unary()
+            return Neg(operand) if sign == "-" else operand
+        return atom()
+
+    def atom():
+        token = advance()
+        if isinstance(token, int):
+            return Const(token)
+        if token == "count":
+            return Count()
+        if token == "(":
+            node = expression()
+            if advance() != ")":
+                raise ValueError(f"Invalid increment rule {text!r}: missing )")
+            return node
+        raise ValueError(f"Invalid increment rule {text!r}")
+
+    node = expression()
+    if position != len(tokens):
+        raise ValueError(f"Invalid increment rule {text!r}")
+    return node
+
+def uses_count(node):
+    if isinstance(node, Count):
+        return True
+    if isinstance(node, Neg):
+        return uses_count(node.operand)
+    if isinstance(node, BinOp):
+        return uses_count(node.left) or uses_count(node.right)
+    return False
+
+def to_source(node, vector=False):
+    """Fully parenthesized Python source; array kernels route // and % through checked helpers."""
+    if isinstance(node, Const):
+        return str(node.value)
+    if isinstance(node, Count):
+        return "count"
+    if isinstance(node, Neg):
+        return f"(-{to_source(node.operand, vector)})"
+    left = to_source(node.left, vector)
+    right = to_source(node.right, vector)
+    if vector and node.op == "//":
+        return f"floordiv({left}, {right})"
+    if vector and node.op == "%":
+        return f"mod({left}, {right})"
+    return f"({left} {node.op} {right})"
+
+def floordiv(a, b):
+    # numpy returns 0 for integer division by zero where Python raises
+    if np.any(b == 0):
+        raise ZeroDivisionError("integer division or modulo by zero")
+    return a // b
+
+def mod(a, b):
+    if np.any(b == 0):
+        raise ZeroDivisionError("integer division or modulo by zero")
+    return a % b
+
+def bounds(node, limit):
+    """Bound |value| of node and of every subexpression, given |count| <= limit."""
+    if isinstance(node, Const):
+        return abs(node.value), abs(node.value)
+    if isinstance(node, Count):
+        return limit, limit
+    if isinstance(node, Neg):
+        return bounds(node.operand, limit)
+
+    left, left_peak = bounds(node.left, limit)
+    right, right_peak = bounds(node.right, limit)
+    if node.op in ("+", "-"):
+        value = left + right
+    elif node.op == "*":
+        value = left * right
+    elif node.op == "//":
+        value = left  # |a // b| <= |a| for any non-zero integer b
+    else:
+        value = right  # |a % b| < |b|
+    return value, max(value, left_peak, right_peak)
+
+def moduli(node):
+    """Constant divisors of %, or None when the rule is not compatible with reducing counts.
+
+    Counts reduced modulo m still give exact results through + - * and through
+    % k whenever k divides m. Floor division, or % by something depending on
+    the count, needs the exact count.
+    """
+    if isinstance(node, (Const, Count)):
+        return set()
+    if isinstance(node, Neg):
+        return moduli(node.operand)
+
+    left = moduli(node.left)
+    right = moduli(node.right)
+    if left is None or right is None:
+        return None
+    if node.op == "//" and uses_count(node):
+        return None
+    if node.op == "%" and uses_count(node):
+        if uses_count(node.right):
+            return None
+        try:
+            left.add(abs(evaluate_constant(node.right)))
+        except ZeroDivisionError:
+            return None  # Raises when the rule is applied, as it should
+    return left | right
+
+def evaluate_constant(node):
+    return eval(to_source(node), {"__builtins__": {}})
+
+class Rule:
+    """A compiled increment rule.
+
+    `scalar` takes one Python int and `vector` a whole numpy array (int64 or
+    object); both raise ZeroDivisionError like plain Python arithmetic. `key`
+    is the rule in a canonical form, independent of how it was written.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.key = to_source(tree)
+        # The sources are generated from the parsed tree, which only holds ints,
+        # `count` and arithmetic, so nothing else can reach eval
+        self.scalar = eval(f"lambda count: {self.key}", {"__builtins__": {}})
+        self.vector = eval(f"lambda count: {to_source(tree, vector=True)}",
+                           {"__builtins__": {}, "floordiv": floordiv, "mod": mod})
+        if not uses_count(tree):
+            # A constant rule still has to return one count per dish
+            self.vector = lambda count: np.full(len(count), self.scalar(0), dtype=count.dtype)
+        self.moduli = moduli(tree)
+
+    @property
+    def reducible(self):
+        return self.moduli is not None
+
+    def bound(self, limit):
+        """Largest |value| the rule can produce at any step, given |count| <= limit."""
+        return bounds(self.tree, limit)[1]
+
+@functools.lru_cache(maxsize=1024)
+def compile_rule(text):
+    """Compile a rule; an empty rule leaves the count unchanged."""
+    text = text.strip()
+    return Rule(parse(text) if text else Count())
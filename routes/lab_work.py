@@ -1,31 +1,54 @@
+import hashlib
+import json
 import logging
+import math
+import os
 import re
+import threading
+import time
 
-from flask import request, jsonify
-from collections import defaultdict, deque
+import numpy as np
+
+from concurrent.futures.process import BrokenProcessPool
+from flask import request, jsonify, Response, stream_with_context
 
 from routes import app
+from routes.checkpoints import CheckpointCache
+from routes.lab_rules import compile_rule
+from routes.pool import get_pool, reset_pool
 
 logger = logging.getLogger(__name__)
 
-# Function to preprocess the increment rule and avoid using 'count *' during processing
+INT64_MAX = np.iinfo(np.int64).max
+
+# Checkpoints of earlier simulations, shared by requests for the same table. Set
+# LAB_CHECKPOINT_DIR to spill runs that no longer fit in memory to local disk.
+CHECKPOINT_MAX_BYTES = int(os.environ.get("LAB_CHECKPOINT_MAX_BYTES", 64 * 1024 * 1024))
+CHECKPOINT_DIR = os.environ.get("LAB_CHECKPOINT_DIR")
+CHECKPOINT_DISK_BYTES = int(os.environ.get("LAB_CHECKPOINT_DISK_BYTES", 1024 * 1024 * 1024))
+MAX_SAVED_STATES = 32  # Per table
+MAX_SAVED_COUNTS = 100_000  # Per table
+MAX_CYCLE_WINDOW = 1 << 16  # Days; longer cycles are simulated in full
+
+CHECKPOINTS = CheckpointCache(CHECKPOINT_MAX_BYTES, CHECKPOINT_DIR, CHECKPOINT_DISK_BYTES)
+
+# Test cases run in parallel, each with its own time limit
+WORKERS = int(os.environ.get("LAB_WORK_WORKERS", 0))  # 0 means one per CPU
+CASE_TIME_LIMIT = float(os.environ.get("LAB_WORK_TIME_LIMIT", 10))  # Seconds
+
+# Streams are for long runs that the client stops by disconnecting, so by
+# default their cases have no time limit; 0 means none
+STREAM_CASE_TIME_LIMIT = float(os.environ.get("LAB_WORK_STREAM_TIME_LIMIT", 0))  # Seconds
+
+# Log the counts every TRACE_EVERY simulated days at DEBUG level; 0 turns it off
+TRACE_EVERY = int(os.environ.get("LAB_WORK_TRACE_EVERY", 0))
+
+# Function to preprocess the increment rule into a compiled Rule (see routes/lab_rules.py),
+# which applies to a single count or to a whole numpy array of counts. Rules are cached,
+# so the same rule text is only compiled once per process.
 def preprocess_increment_rule(increment):
-    increment = increment.strip()
-
-    if increment == 'count * count':
-        return lambda count: count * count  # Preprocess to square the count
-    elif 'count *' in increment:
-        # Extract the multiplier and return a function that multiplies the count
-        factor = int(increment.split('*')[1].strip())
-        return lambda count: count * factor
-    elif 'count +' in increment:
-        # Extract the addend and return a function that adds the value
-        addend = int(increment.split('+')[1].strip())
-        return lambda count: count + addend
-    else:
-        # Default: if no valid rule, return the count unchanged
-        return lambda count: count
-    
+    return compile_rule(increment)
+
 # Function to parse the markdown input into structured data
 def parse_markdown_table(md_table):
     labs = []
@@ -51,72 +74,372 @@ def parse_markdown_table(md_table):
 
     return labs
 
-def simulate_lab_work(labs, total_days=10000, interval=1000):
-    analysis_count = defaultdict(int)  # Tracks counts at intervals for each lab
-    lab_dict = defaultdict(dict)  # Stores each lab's working dishes and conditions
-    res = {}
+def to_cells(values):
+    """Build a counts array, falling back to Python ints when int64 is too small."""
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:
+        return np.array(values, dtype=object)
+
+def apply_rule(rule, cells):
+    # Counts that could overflow int64 anywhere in the rule are carried as exact Python ints
+    if cells.dtype != object and len(cells) and rule.bound(int(max(cells.max(), -cells.min()))) > INT64_MAX:
+        cells = cells.astype(object)
+    if cells.dtype == object:
+        return np.array([rule.scalar(count) for count in cells], dtype=object)
+    return rule.vector(cells)
+
+def reduce_cells(cells, modulus):
+    """Reduce counts modulo `modulus`, returning to int64 once they fit again.
+
+    A modulus of None means counts must stay exact.
+    """
+    if modulus is not None:
+        if modulus > INT64_MAX:
+            cells = cells.astype(object)
+        cells = cells % modulus
+    if cells.dtype == object and len(cells) and max(cells.max(), -cells.min()) <= INT64_MAX:
+        cells = cells.astype(np.int64)
+    return cells
+
+def run_day(queues, rules, conditions, index, modulus, analysis_count):
+    """Process one day: every lab in sorted order handles all of its dishes."""
+    for i in range(len(queues)):
+        chunks = queues[i]
+        if not chunks:
+            continue
+        cells = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        queues[i] = []
+        if not len(cells):
+            continue
+
+        div, lab_if_true, lab_if_false = conditions[i]
+        if div == 0:
+            raise ZeroDivisionError("integer division or modulo by zero")
+        new_cells = reduce_cells(apply_rule(rules[i], cells), modulus)
+        analysis_count[i] += len(cells)
+
+        # Pass the new cells to the appropriate lab based on the condition
+        passed = new_cells % div == 0
+        if passed.any():
+            queues[index[lab_if_true]].append(new_cells[passed])
+        if not passed.all():
+            queues[index[lab_if_false]].append(new_cells[~passed])
+
+def snapshot(queues):
+    """Merge each lab's queue into one array and return the state with its fingerprint.
+
+    The fingerprint does not depend on the order of dishes within a lab, so two
+    states with different fingerprints are certainly different.
+    """
+    state = []
+    fingerprint = []
+    for i, chunks in enumerate(queues):
+        cells = chunks[0] if len(chunks) == 1 else np.concatenate(chunks) if chunks else to_cells([])
+        queues[i] = [cells]
+        state.append(cells)
+        if cells.dtype == object:
+            fingerprint.append((len(cells), sum(cells)))
+        else:
+            mixed = cells.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)  # Wraps around
+            mixed ^= mixed >> np.uint64(29)
+            fingerprint.append((len(cells), int(mixed.sum())))
+    return state, fingerprint
+
+def same_state(a, b):
+    return all(np.array_equal(np.sort(x), np.sort(y)) for x, y in zip(a, b))
+
+def table_key(labs):
+    """Hash a parsed table so that equivalent tables share their checkpoints."""
+    lab_dict = {lab['lab']: lab for lab in labs}
+    canonical = [
+        # Dishes are independent, so their order within a lab does not matter
+        [key, sorted(lab['cell_counts']), lab['increment'].key, lab['condition']]
+        for key, lab in sorted(lab_dict.items())
+    ]
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+class LabRun:
+    """Everything learned so far about one lab table.
+
+    `counts` holds the analysis counts on reported days, `states` a few lab
+    queues to resume from, and `cycle` the repeating stretch once it is found.
+    """
+
+    def __init__(self, state):
+        self.counts = {0: [0] * len(state)}
+        self.states = {0: state}
+        self.cycle = None
+        self.lock = threading.Lock()  # Guards the dicts against concurrent simulations
+
+    def __getstate__(self):
+        with self.lock:
+            state = self.__dict__.copy()
+            state['counts'] = dict(self.counts)
+            state['states'] = dict(self.states)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Approximate memory held, in bytes."""
+        with self.lock:
+            labs = len(self.counts[0])
+            history = len(self.cycle[1]) if self.cycle else 0
+            cells = sum(cells.nbytes for state in self.states.values() for cells in state)
+            return cells + 8 * labs * (len(self.counts) + history)
+
+    def count_at(self, day):
+        counts = self.counts.get(day)
+        if counts is not None:
+            return counts
+        if self.cycle is not None and day >= self.cycle[0]:
+            start, history = self.cycle
+            period = len(history) - 1
+            cycles, offset = divmod(day - start, period)
+            gain = [b - a for a, b in zip(history[0], history[-1])]
+            return [count + cycles * g for count, g in zip(history[offset], gain)]
+        return None
+
+    def resume_day(self, day):
+        """The last day before `day` with a saved state."""
+        with self.lock:
+            return max(saved for saved in self.states if saved < day)
 
-    # Populate lab_dict with data from labs
-    for lab in labs:
-        lab_dict[lab['lab']] = {
-            'cell_counts': deque(lab['cell_counts']),
-            'increment': lab['increment'],
-            'condition': lab['condition']
-        }
+    def record(self, day, counts, state):
+        with self.lock:
+            if len(self.counts) < MAX_SAVED_COUNTS:
+                self.counts[day] = counts
+            self.states[day] = state
+            if len(self.states) > 2 * MAX_SAVED_STATES:
+                self.thin()
 
-    # Now get the sorted list of lab keys after lab_dict is populated
+    def thin(self):
+        """Keep at most MAX_SAVED_STATES states, spread over the days simulated."""
+        while len(self.states) > MAX_SAVED_STATES:
+            days = sorted(self.states)
+            keep = set(days[::2]) | {days[-1]}
+            self.states = {day: self.states[day] for day in days if day in keep}
+        # States without their counts cannot be resumed from
+        self.states = {day: state for day, state in self.states.items() if day in self.counts}
+
+def iter_lab_work(labs, total_days=10000, interval=1000, cache=None, deadline=None):
+    """Simulate the labs, yielding (day, counts) on each interval day as it is reached.
+
+    Counts are kept modulo the LCM of the divisors when the rules allow it, and
+    a repeating state is fast-forwarded. With a `cache`, days are checkpointed
+    and resumed; past the monotonic `deadline` a TimeoutError is raised.
+    """
+    lab_dict = {lab['lab']: lab for lab in labs}  # Later rows for the same lab win
     lab_keys = sorted(lab_dict.keys())
+    index = {key: i for i, key in enumerate(lab_keys)}
+
+    rules = [lab_dict[key]['increment'] for key in lab_keys]
+    conditions = [lab_dict[key]['condition'] for key in lab_keys]
+    # Zero divisors are left out here; they still raise when their lab runs
+    modulus = None
+    if all(rule.reducible for rule in rules):
+        divisors = [abs(condition[0]) for condition in conditions if condition]
+        divisors.extend(k for rule in rules for k in rule.moduli)
+        modulus = math.lcm(*(k for k in divisors if k))
+
+    table = table_key(labs)
+    run = cache.get(table) if cache is not None else None
+    if run is None:
+        run = LabRun([reduce_cells(to_cells(lab_dict[key]['cell_counts']), modulus) for key in lab_keys])
+
+    day = interval  # Next day to report
+    simulated = False
+    try:
+        while day <= total_days:
+            counts = run.count_at(day)
+            if counts is not None:
+                yield day, counts
+                day += interval
+                continue
+
+            # Simulate from the last saved state; this stops early once a cycle is found
+            simulated = True
+            start = run.resume_day(day)
+            for reached, counts in simulate_from(run, start, total_days, interval, rules, conditions, index, modulus, deadline):
+                if reached >= day:
+                    yield reached, counts
+                    day = reached + interval
+    finally:
+        if simulated:
+            with run.lock:
+                run.thin()
+            if cache is not None:
+                cache.put(table, run)
+
+def simulate_lab_work(labs, total_days=10000, interval=1000, cache=None, deadline=None):
+    """Return {day: counts} for every interval day; see iter_lab_work."""
+    return dict(iter_lab_work(labs, total_days, interval, cache, deadline))
+
+def simulate_from(run, start, total_days, interval, rules, conditions, index, modulus, deadline=None):
+    """Step from the state saved on day `start`, recording and yielding interval days."""
+    queues = [[cells] for cells in run.states[start]]
+    analysis_count = np.array(run.counts[start], dtype=np.int64)  # Tracks counts for each lab
+
+    # Saved state for cycle detection, and the counts on each day since it.
+    # Detection stops once the window would exceed MAX_CYCLE_WINDOW days.
+    saved_state, saved_fingerprint = snapshot(queues)
+    saved_day = start
+    history = [analysis_count.tolist()]
+    power = 1
 
     # Simulate days
-    for day in range(1, total_days + 1):
-        # Dictionary to track the new state of cells being passed between labs each day
-        next_lab_work = defaultdict(list)
-
-        # Iterate over the labs in sorted order
-        for key in lab_keys:
-            increment_rule = lab_dict[key]['increment']
-            div, lab_if_true, lab_if_false = lab_dict[key]['condition']
-
-            cell_counts = lab_dict[key]["cell_counts"]
-
-            while cell_counts:
-                cell_count = cell_counts.popleft()  # Remove the first element in the queue
-                new_cell = increment_rule(cell_count)
-                
-                # Pass the new cell to the appropriate lab based on the condition
-                if new_cell % div == 0:
-                    next_lab_work[lab_if_true].append(new_cell)
-                else:
-                    next_lab_work[lab_if_false].append(new_cell)
-                analysis_count[key] += 1            
-        
-            # Move the dishes to the respective labs for the next day
-            for key in next_lab_work:
-                for cell_count in next_lab_work[key]:   
-                    lab_dict[key]["cell_counts"].append(cell_count)
-            next_lab_work = defaultdict(list)
-        
+    for day in range(start + 1, total_days + 1):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"time limit exceeded on day {day}")
+        run_day(queues, rules, conditions, index, modulus, analysis_count)
+        if TRACE_EVERY and day % TRACE_EVERY == 0:
+            logger.debug(f"Lab work day {day}: {analysis_count.tolist()}")
+
+        counts = analysis_count.tolist()
+        state, fingerprint = snapshot(queues)
         if day % interval == 0:
-            res[day] = [analysis_count[key] for key in lab_keys]
-        print(day)
-        print(analysis_count)
+            run.record(day, counts, state)
+            yield day, counts
+        if history is None:
+            continue
+
+        history.append(counts)
+        if fingerprint == saved_fingerprint and same_state(state, saved_state):
+            # Days after `day` repeat the days after `saved_day`
+            run.cycle = (saved_day, history)
+            return
+
+        if day - saved_day == power:
+            if power >= MAX_CYCLE_WINDOW:
+                history = saved_state = None
+                continue
+            saved_state, saved_fingerprint = state, fingerprint
+            saved_day = day
+            history = [history[-1]]
+            power *= 2
+
+# Simulation horizon when the request does not give one
+DEFAULT_TOTAL_DAYS = 10000
+DEFAULT_INTERVAL = 1000
 
-    return res
+def positive_int_arg(name, default):
+    """Read a positive integer query parameter; returns None when it is invalid."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+def checkpoint_key(test_case):
+    """The CHECKPOINTS key of a markdown table, or None if it does not parse."""
+    try:
+        return table_key(parse_markdown_table(test_case))
+    except Exception:
+        return None
+
+def run_test_case(job):
+    """Simulate one (markdown table, total_days, interval, time_limit, run) job.
+
+    Meant for pool workers: it never raises, so one failing test case does
+    not fail the rest of the request. `run` is the table's checkpointed
+    LabRun, if any; returns (result, updated run) so the caller can store it.
+    """
+    test_case, total_days, interval, time_limit, run = job
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    cache = CheckpointCache(float("inf"))  # Only holds this table's run
+    key = None
+    try:
+        labs = parse_markdown_table(test_case)
+        key = table_key(labs)
+        if run is not None:
+            cache.put(key, run)
+        result = simulate_lab_work(labs, total_days, interval, cache, deadline)
+    except Exception as e:
+        result = {"error": str(e)}
+    return result, cache.get(key) if key is not None else None
+
+def read_lab_work_request():
+    """Return (test cases, total_days, interval), or (error response, None, None)."""
+    # Optional ?totalDays=...&interval=... override the horizon for every test case
+    total_days = positive_int_arg("totalDays", DEFAULT_TOTAL_DAYS)
+    interval = positive_int_arg("interval", DEFAULT_INTERVAL)
+    if total_days is None or interval is None:
+        return (jsonify({"error": "totalDays and interval must be positive integers"}), 400), None, None
+
+    data = request.json  # Extract the input data
+    if not isinstance(data, list) or not all(isinstance(test_case, str) for test_case in data):
+        return (jsonify({"error": "Expected a list of markdown tables"}), 400), None, None
+    return data, total_days, interval
 
 # Define the POST endpoint
 @app.route('/lab_work', methods=['POST'])
 def lab_work():
+    data, total_days, interval = read_lab_work_request()
+    if total_days is None:
+        return data
+
+    # Each test case gets its result, or {"error": ...} if it failed or ran out of time
+    workers = WORKERS or os.cpu_count()
+    pool = get_pool("lab_work", workers)
+    # Checkpoints stay in this process, so every worker can resume any table:
+    # each job carries its table's saved run and brings back the updated one
+    keys = [checkpoint_key(test_case) for test_case in data]
+    jobs = [
+        (test_case, total_days, interval, CASE_TIME_LIMIT, CHECKPOINTS.get(key) if key else None)
+        for test_case, key in zip(data, keys)
+    ]
     try:
-        data = request.json  # Extract the input data
-        results = []
+        futures = [pool.submit(run_test_case, job) for job in jobs]
+    except Exception as e:
+        logger.error(f"Error in /lab_work: {e}")
+        reset_pool("lab_work")
+        return jsonify({"error": str(e)}), 500
 
-        # Process each test case
-        for test_case in data:
-            labs = parse_markdown_table(test_case)
-            result = simulate_lab_work(labs)
-            results.append(result)
+    # A case whose worker died (e.g. killed for running out of memory) gets an error of its own
+    results = []
+    broken = False
+    for key, future in zip(keys, futures):
+        try:
+            result, run = future.result()
+        except Exception as e:
+            logger.error(f"Error in /lab_work: {e}")
+            broken = broken or isinstance(e, BrokenProcessPool)
+            result, run = {"error": str(e) or type(e).__name__}, None
+        if run is not None:
+            CHECKPOINTS.put(key, run)
+        results.append(result)
+    if broken:
+        reset_pool("lab_work")
+    return jsonify(results)  # Return the result in JSON format
 
-        return jsonify(results)  # Return the result in JSON format
+@app.route('/lab_work/stream', methods=['POST'])
+def lab_work_stream():
+    """Streaming variant of /lab_work.
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
+    Sends an NDJSON line {"case": i, "day": d, "counts": [...]} as each interval
+    day is simulated, or {"case": i, "error": ...} for a failing case. Cases only
+    time out when LAB_WORK_STREAM_TIME_LIMIT is set.
+    """
+    data, total_days, interval = read_lab_work_request()
+    if total_days is None:
+        return data
+
+    def generate():
+        for case, test_case in enumerate(data):
+            deadline = time.monotonic() + STREAM_CASE_TIME_LIMIT if STREAM_CASE_TIME_LIMIT else None
+            try:
+                labs = parse_markdown_table(test_case)
+                for day, counts in iter_lab_work(labs, total_days, interval, CHECKPOINTS, deadline):
+                    yield json.dumps({"case": case, "day": day, "counts": counts}) + "\n"
+            except Exception as e:
+                yield json.dumps({"case": case, "error": str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -0,0 +1,39 @@
+import logging
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_lock = threading.Lock()
+
+def get_pool(name, max_workers=None):
+    """Return the process pool registered under name, creating it on first use.
+
+    Pools belong to the current process (each gunicorn worker gets its own)
+    and are reused across requests so worker start-up is paid once.
+    """
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+            _pools[name] = pool
+        return pool
+
+def reset_pool(name, terminate=False):
+    """Drop a pool, e.g. after a worker died, so the next request starts a fresh one.
+
+    With terminate, its worker processes are killed too, e.g. to stop a job
+    that overran its deadline.
+    """
+    with _lock:
+        pool = _pools.pop(name, None)
+    if pool is not None:
+        logger.warning(f"Resetting process pool {name}")
+        processes = list((pool._processes or {}).values())  # Cleared by shutdown
+        pool.shutdown(wait=False, cancel_futures=True)
+        if terminate:
+            for process in processes:
+                process.terminate()
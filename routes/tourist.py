@@ -1,151 +1,598 @@
+import csv
+import hashlib
+import heapq
+import io
+import json
 import logging
+import os
+import pickle
+import tempfile
+import time
+
+from collections import namedtuple
+
+import numpy as np
+
 from flask import request, jsonify
 
 from routes import app
+from routes.pool import get_pool, reset_pool
+from routes.validation import is_positive
 
 logger = logging.getLogger(__name__)
 
-train_lines = {
-    "Tokyo Metro Ginza Line": [
-        "Asakusa", "Tawaramachi", "Inaricho", "Ueno", "Ueno-hirokoji", "Suehirocho",
-        "Kanda", "Mitsukoshimae", "Nihombashi", "Kyobashi", "Ginza", "Shimbashi",
-        "Toranomon", "Tameike-sanno", "Akasaka-mitsuke", "Nagatacho", "Aoyama-itchome",
-        "Gaiemmae", "Omotesando", "Shibuya"
-    ],
-    "Tokyo Metro Marunouchi Line": [
-        "Ogikubo", "Minami-asagaya", "Shin-koenji", "Higashi-koenji", "Shin-nakano",
-        "Nakano-sakaue", "Nishi-shinjuku", "Shinjuku", "Shinjuku-sanchome", "Shin-ochanomizu",
-        "Ochanomizu", "Awajicho", "Otemachi", "Tokyo", "Ginza", "Kasumigaseki", "Kokkai-gijidomae",
-        "Akasaka-mitsuke", "Yotsuya", "Yotsuya-sanchome", "Shinjuku-gyoemmae", "Nishi-shinjuku-gochome",
-        "Nakano-fujimicho", "Nakano-shimbashi", "Nakano-sakaue", "Shinjuku-sanchome", "Kokkai-gijidomae",
-        "Kasumigaseki", "Ginza", "Tokyo", "Otemachi", "Awajicho", "Shin-ochanomizu", "Ochanomizu"
-    ],
-    "Tokyo Metro Hibiya Line": [
-        "Naka-meguro", "Ebisu", "Hiroo", "Roppongi", "Kamiyacho", "Kasumigaseki", "Hibiya",
-        "Ginza", "Higashi-ginza", "Tsukiji", "Hatchobori", "Kayabacho", "Nihombashi",
-        "Kodemmacho", "Akihabara", "Naka-okachimachi", "Ueno", "Iriya", "Minowa",
-        "Minami-senju", "Kita-senju"
-    ],
-    "Tokyo Metro Tozai Line": [
-        "Nakano", "Ochiai", "Takadanobaba", "Waseda", "Kagurazaka", "Iidabashi", "Kudanshita",
-        "Takebashi", "Otemachi", "Nihombashi", "Kayabacho", "Monzen-nakacho", "Kiba",
-        "Toyosu", "Minami-sunamachi", "Nishi-kasai", "Kasai", "Urayasu", "Minami-gyotoku",
-        "Gyotoku", "Myoden", "Baraki-nakayama", "Nishi-funabashi"
-    ],
-    "Tokyo Metro Chiyoda Line": [
-        "Yoyogi-uehara", "Yoyogi-koen", "Meiji-jingumae", "Omotesando", "Nogizaka", "Akasaka",
-        "Kokkai-gijidomae", "Kasumigaseki", "Hibiya", "Nijubashimae", "Otemachi",
-        "Shin-ochanomizu", "Yushima", "Nezu", "Sendagi", "Nishi-nippori", "Machiya",
-        "Kita-senju", "Ayase", "Kita-ayase"
-    ],
-    "Tokyo Metro Yurakucho Line": [
-        "Wakoshi", "Chikatetsu-narimasu", "Chikatetsu-akatsuka", "Heiwadai", "Hikawadai",
-        "Kotake-mukaihara", "Senkawa", "Kanamecho", "Ikebukuro", "Higashi-ikebukuro",
-        "Gokokuji", "Edogawabashi", "Iidabashi", "Ichigaya", "Kojimachi", "Nagatacho",
-        "Sakuradamon", "Yurakucho", "Ginza-itchome", "Shintomicho", "Toyocho",
-        "Kiba", "Toyosu", "Tsukishima", "Shintomicho", "Tatsumi", "Shinonome", "Ariake"
-    ],
-    "Tokyo Metro Hanzomon Line": [
-        "Shibuya", "Omotesando", "Aoyama-itchome", "Nagatacho", "Hanzomon", "Kudanshita",
-        "Jimbocho", "Otemachi", "Mitsukoshimae", "Suitengumae", "Kiyosumi-shirakawa",
-        "Sumiyoshi", "Kinshicho", "Oshiage"
-    ],
-    "Tokyo Metro Namboku Line": [
-        "Meguro", "Shirokanedai", "Shirokane-takanawa", "Azabu-juban", "Roppongi-itchome",
-        "Tameike-sanno", "Nagatacho", "Yotsuya", "Ichigaya", "Iidabashi", "Korakuen",
-        "Todaimae", "Hon-komagome", "Komagome", "Nishigahara", "Oji", "Oji-kamiya",
-        "Shimo", "Akabane-iwabuchi"
-    ],
-    "Tokyo Metro Fukutoshin Line": [
-        "Wakoshi", "Chikatetsu-narimasu", "Chikatetsu-akatsuka", "Narimasu", "Shimo-akatsuka",
-        "Heiwadai", "Hikawadai", "Kotake-mukaihara", "Senkawa", "Kanamecho", "Ikebukuro",
-        "Zoshigaya", "Nishi-waseda", "Higashi-shinjuku", "Shinjuku-sanchome", "Kita-sando",
-        "Meiji-jingumae", "Shibuya"
-    ],
-    "Toei Asakusa Line": [
-        "Nishi-magome", "Magome", "Nakanobu", "Togoshi", "Gotanda", "Takanawadai",
-        "Sengakuji", "Mita", "Shiba-koen", "Daimon", "Shimbashi", "Higashi-ginza",
-        "Takaracho", "Nihombashi", "Ningyocho", "Higashi-nihombashi", "Asakusabashi",
-        "Kuramae", "Asakusa", "Honjo-azumabashi", "Oshiage"
-    ],
-    "Toei Mita Line": [
-        "Meguro", "Shirokanedai", "Shirokane-takanawa", "Mita", "Shiba-koen", "Onarimon",
-        "Uchisaiwaicho", "Hibiya", "Otemachi", "Jimbocho", "Suidobashi", "Kasuga",
-        "Hakusan", "Sengoku", "Sugamo", "Nishi-sugamo", "Shin-itabashi", "Itabashi-kuyakushomae",
-        "Itabashi-honcho", "Motohasunuma", "Shin-takashimadaira", "Nishidai", "Hasune",
-        "Takashimadaira", "Shimura-sakaue", "Shimura-sanchome", "Nishidai"
-    ],
-    "Toei Shinjuku Line": [
-        "Shinjuku", "Shinjuku-sanchome", "Akebonobashi", "Ichigaya", "Kudanshita",
-        "Jimbocho", "Ogawamachi", "Iwamotocho", "Bakuro-yokoyama", "Hamacho",
-        "Morishita", "Kikukawa", "Sumiyoshi", "Nishi-ojima", "Ojima", "Higashi-ojima",
-        "Funabori", "Ichinoe", "Mizue", "Shinozaki", "Motoyawata"
-    ],
-    "Toei Oedo Line": [
-        "Hikarigaoka", "Nerima-kasugacho", "Toshimaen", "Nerima", "Nerima-sakamachi",
-        "Shin-egota", "Ochiai-minami-nagasaki", "Nakai", "Higashi-nakano", "Nakano-sakaue",
-        "Nishi-shinjuku-gochome", "Tochomae", "Shinjuku-nishiguchi", "Higashi-shinjuku",
-        "Wakamatsu-kawada", "Ushigome-yanagicho", "Ushigome-kagurazaka", "Iidabashi",
-        "Kasuga", "Hongosanchome", "Ueno-okachimachi", "Shin-okachimachi", "Kuramae",
-        "Ryogoku", "Morishita", "Kiyosumi-shirakawa", "Monzen-nakacho", "Tsukishima",
-        "Kachidoki", "Shiodome", "Daimon", "Akasaka-mitsuke", "Roppongi", "Aoyama-itchome",
-        "Shinjuku", "Tochomae", "Shinjuku", "Shinjuku-sanchome", "Higashi-shinjuku",
-        "Wakamatsu-kawada", "Ushigome-yanagicho", "Ushigome-kagurazaka", "Iidabashi",
-        "Kasuga", "Hongosanchome", "Ueno-okachimachi", "Shin-okachimachi", "Kuramae",
-        "Ryogoku", "Morishita", "Kiyosumi-shirakawa", "Monzen-nakacho", "Tsukishima",
-        "Kachidoki", "Shiodome", "Daimon", "Shiodome", "Tsukishima"
-    ]
-}
-
-travel_times = {
-    "Tokyo Metro Ginza Line": 2,
-    "Tokyo Metro Marunouchi Line": 3,
-    "Tokyo Metro Hibiya Line": 2.5,
-    "Tokyo Metro Tozai Line": 4,
-    "Tokyo Metro Chiyoda Line": 1.5,
-    "Tokyo Metro Yurakucho Line": 2,
-    "Tokyo Metro Hanzomon Line": 2,
-    "Tokyo Metro Namboku Line" : 1,
-    "Tokyo Metro Fukutoshin Line": 3,
-    "Toei Asakusa Line": 3.5,
-    "Toei Mita Line": 4,
-    "Toei Shinjuku Line": 1.5,
-    "Toei Oedo Line": 1
-}
-
-# Helper function to perform DFS and calculate the best path
-def dfs(locations, train_lines, travel_times, current_station, time_left, current_satisfaction, current_path, visited, start_station, best_result):
-    # If we've returned to the start, update the best result if this path is better
-    if current_station == start_station and len(current_path) > 1:
-        if current_satisfaction > best_result['satisfaction']:
-            best_result['satisfaction'] = current_satisfaction
-            best_result['path'] = current_path[:]
-        return
-
-    for line, stations in train_lines.items():
-        if current_station in stations:
-            current_index = stations.index(current_station)
-            for direction in [-1, 1]:  # Explore neighbors both backwards and forwards on the line
-                next_index = current_index + direction
-                if 0 <= next_index < len(stations):
-                    next_station = stations[next_index]
-                    travel_time = travel_times[line]
-                    
-                    # Check if we have enough time to visit the next station
-                    satisfaction, min_time = locations[next_station]
-                    total_time = travel_time + min_time
-
-                    if next_station not in visited and time_left >= total_time:
-                        visited.add(next_station)
-                        current_path.append(next_station)
-
-                        # Recur for the next station
-                        dfs(locations, train_lines, travel_times, next_station, time_left - total_time, 
-                            current_satisfaction + satisfaction, current_path, visited, start_station, best_result)
-
-                        # Backtrack
-                        visited.remove(next_station)
-                        current_path.pop()
+# Where the rail network is read from: JSON, or CSV with one row per stop
+NETWORK_PATH = os.environ.get("TOURIST_NETWORK", os.path.join(os.path.dirname(__file__), "tourist_network.json"))
+
+# Where compiled network indexes are kept between restarts
+CACHE_DIR = os.environ.get("TOURIST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tourist-cache"))
+
+def read_lines(path, source):
+    """Parse network data into (line name, stations, minutes between consecutive stations) tuples.
+
+    JSON data is {"lines": [{"name", "travelTime", "stations"}]}, with one
+    travel time for the whole line. CSV data has a header and one row per
+    stop, GTFS style: line,sequence,station,minutes, where minutes is the
+    travel time from the previous stop on the line (empty for the first).
+    """
+    text = source.decode("utf-8-sig")
+    if not path.endswith(".csv"):
+        return [
+            (line["name"], line["stations"], [line["travelTime"]] * (len(line["stations"]) - 1))
+            for line in json.loads(text)["lines"]
+        ]
+
+    stops = {}  # Line name -> [(sequence, station, minutes)], in order of first appearance
+    for row in csv.DictReader(io.StringIO(text)):
+        minutes = row["minutes"].strip()
+        stops.setdefault(row["line"], []).append((int(row["sequence"]), row["station"], float(minutes) if minutes else None))
+    lines = []
+    for name, rows in stops.items():
+        rows.sort(key=lambda row: row[0])
+        lines.append((name, [station for _, station, _ in rows], [minutes for _, _, minutes in rows[1:]]))
+    return lines
+
+Network = namedtuple("Network", "names ids offsets neighbors times")
+
+def compile_network(lines):
+    """Intern station names as integer ids and build a CSR adjacency list from read_lines.
+
+    The neighbors of station i are neighbors[offsets[i]:offsets[i + 1]], with
+    the matching travel times in times. Every occurrence of a station on a
+    line contributes its neighbors, so stations listed twice on loop lines
+    (e.g. the Oedo line) are connected both times. Stations linked by
+    several lines keep the fastest connection.
+    """
+    names = []
+    ids = {}
+    adjacency = []  # Per station: neighbor id -> travel time, in discovery order
+
+    def intern(name):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+            adjacency.append({})
+        return ids[name]
+
+    for line, stations, minutes in lines:
+        for a, b, travel_time in zip(stations, stations[1:], minutes):
+            if travel_time is None:
+                raise ValueError(f"Missing travel time to {b} on {line}")
+            a, b = intern(a), intern(b)
+            if a == b:
+                continue
+            for u, v in ((a, b), (b, a)):
+                if v not in adjacency[u] or travel_time < adjacency[u][v]:
+                    adjacency[u][v] = travel_time
+
+    offsets = [0]
+    neighbors = []
+    times = []
+    for edges in adjacency:
+        neighbors.extend(edges.keys())
+        times.extend(edges.values())
+        offsets.append(len(neighbors))
+    return Network(names, ids, offsets, neighbors, times)
+
+TravelTable = namedtuple("TravelTable", "times previous")
+
+def shortest_travel_times(network):
+    """All-pairs shortest travel times, by Dijkstra from every station.
+
+    Returns a TravelTable of two n x n arrays: times[a, b] is the least travel
+    time from a to b, and previous[a, b] the station before b on that path
+    (-1 when b is a or unreachable).
+    """
+    n = len(network.names)
+    times = np.full((n, n), np.inf)
+    previous = np.full((n, n), -1, dtype=np.int32)
+    offsets, neighbors, edge_times = network.offsets, network.neighbors, network.times
+    for source in range(n):
+        best = [float("inf")] * n
+        before = [-1] * n
+        best[source] = 0
+        heap = [(0, source)]
+        while heap:
+            elapsed, station = heapq.heappop(heap)
+            if elapsed > best[station]:
+                continue
+            for k in range(offsets[station], offsets[station + 1]):
+                neighbor = neighbors[k]
+                total = elapsed + edge_times[k]
+                if total < best[neighbor]:
+                    best[neighbor] = total
+                    before[neighbor] = station
+                    heapq.heappush(heap, (total, neighbor))
+        times[source] = best
+        previous[source] = before
+    return TravelTable(times, previous)
+
+# Compiled index files: magic, little-endian uint64 header length, JSON
+# header, then the arrays the header lists, each aligned to INDEX_ALIGNMENT.
+# Bump the magic when the layout or the compilation changes.
+INDEX_MAGIC = b"TOURNET1"
+INDEX_ALIGNMENT = 64
+
+def write_index(path, digest, network, travel):
+    arrays = {
+        "offsets": np.asarray(network.offsets, dtype=np.int32),
+        "neighbors": np.asarray(network.neighbors, dtype=np.int32),
+        "times": np.asarray(network.times, dtype=np.float64),
+        "travel_times": np.ascontiguousarray(travel.times, dtype=np.float64),
+        "previous": np.ascontiguousarray(travel.previous, dtype=np.int32),
+    }
+    layout = {}
+    position = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), position]
+        position += -(-array.nbytes // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+    header = json.dumps({"hash": digest, "names": network.names, "arrays": layout}).encode()
+    start = -(-(len(INDEX_MAGIC) + 8 + len(header)) // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so other workers never map a partial file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(INDEX_MAGIC + len(header).to_bytes(8, "little") + header)
+        for name, array in arrays.items():
+            f.seek(start + layout[name][2])
+            f.write(array.tobytes())
+        f.truncate(start + position)
+    os.replace(temporary, path)
+
+def read_index(path, digest):
+    """Map a compiled index read-only; its pages are shared by every process using it."""
+    with open(path, "rb") as f:
+        magic = f.read(len(INDEX_MAGIC))
+        header_length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_length))
+    if magic != INDEX_MAGIC or header["hash"] != digest:
+        raise ValueError("stale or foreign index")
+
+    start = -(-(len(INDEX_MAGIC) + 8 + header_length) // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+
+    names = header["names"]
+    network = Network(names, {name: i for i, name in enumerate(names)},
+                      arrays["offsets"], arrays["neighbors"], arrays["times"])
+    return network, TravelTable(arrays["travel_times"], arrays["previous"])
+
+def load_network(path=NETWORK_PATH, cache_dir=CACHE_DIR):
+    """Network and TravelTable for a network data file.
+
+    Compiling takes an all-pairs Dijkstra, so the result is kept in
+    cache_dir as a memory-mapped index named after a hash of the data file:
+    workers map the same file instead of each building their own, and a
+    changed file gets a fresh index.
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(INDEX_MAGIC + source).hexdigest()
+    index_path = os.path.join(cache_dir, f"network-{digest[:16]}.idx")
+    try:
+        return read_index(index_path, digest)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable network index {index_path}: {e}")
+
+    network = compile_network(read_lines(path, source))
+    travel = shortest_travel_times(network)
+    try:
+        write_index(index_path, digest, network, travel)
+        return read_index(index_path, digest)
+    except OSError as e:
+        logger.warning(f"Could not cache network index in {cache_dir}: {e}")
+    return network, travel
+
+NETWORK, TRAVEL = load_network()
+
+def travel_path(travel, a, b):
+    """Stations passed from a to b, excluding a and including b."""
+    path = []
+    while b != a:
+        path.append(b)
+        b = int(travel.previous[a, b])
+    return path[::-1]
+
+# Slack for comparing float time sums that were added up in different orders
+TIME_EPSILON = 1e-9
+
+# Cap on the (visited stations, current station) states remembered per search
+MAX_SEEN_STATES = 250_000
+
+# Search budget per request unless it asks for another one, and how often the
+# clock is read against it
+TIME_BUDGET = float(os.environ.get("TOURIST_TIME_BUDGET", 5.0))  # Seconds
+DEADLINE_CHECK_INTERVAL = 256  # Search nodes
+
+# Searches still running after PARALLEL_AFTER_NODES nodes are split by first
+# stop across a pool of worker processes
+WORKERS = int(os.environ.get("TOURIST_WORKERS", 0))  # 0 means one per CPU
+PARALLEL_AFTER_NODES = 5_000
+
+# Where parallel searches keep the file their branches share. /dev/shm keeps it
+# in memory; it is a plain file rather than multiprocessing.shared_memory, whose
+# resource tracker reports segments that workers attached to as leaked.
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+class RouteSearch:
+    """Branch-and-bound search for the most satisfying round trip from start.
+
+    Routes stop at positive-satisfaction stations, travelling between them by
+    shortest paths. Pruning only drops branches that cannot beat the best route,
+    so the result is the exact optimum.
+    """
+
+    def __init__(self, network, travel, satisfaction, min_time, start, time_limit):
+        self.time_limit = time_limit
+        # Condensed node 0 is start; the others are the stations worth visiting
+        self.stations = [start] + [
+            station for station in range(len(network.names))
+            if station != start and min_time[station] is not None and satisfaction[station] > 0
+        ]
+        self.satisfaction = [satisfaction[station] for station in self.stations]
+        self.min_time = [min_time[station] for station in self.stations]
+        self.travel = travel
+        times = travel.times[np.ix_(self.stations, self.stations)].tolist()
+
+        inf = float("inf")
+        count = len(self.stations)
+        start_time = min_time[start] if min_time[start] is not None else inf
+        # Visiting v from u costs cost[u][v]; arriving back at start costs cost[u][0]
+        self.cost = [
+            [times[u][v] + (self.min_time[v] if v else start_time) for v in range(count)]
+            for u in range(count)
+        ]
+        self.return_time = [self.cost[u][0] for u in range(count)]
+        self.arrival_cost = [
+            min((self.cost[u][v] for u in range(count) if u != v), default=inf) for v in range(count)
+        ]
+
+        # Moves from each node, best satisfaction per minute first
+        self.moves = []
+        for u in range(count):
+            moves = [(v, self.cost[u][v]) for v in range(1, count) if v != u and self.cost[u][v] < inf]
+            moves.sort(key=lambda move: self.satisfaction[move[0]] / max(move[1], TIME_EPSILON), reverse=True)
+            self.moves.append(moves)
+
+        # Stations for the bound, best satisfaction per minute first
+        self.candidates = sorted(
+            range(1, count),
+            key=lambda v: self.satisfaction[v] / max(self.arrival_cost[v], TIME_EPSILON),
+            reverse=True,
+        )
+
+        self.visited = [False] * count
+        self.visited[0] = True
+        self.route = [0]
+        self.mask = 1  # Bit v is set when node v is on the route
+        self.seen = {}  # (mask, node) -> most time left it was reached with
+        self.best_satisfaction = 0
+        self.best_route = []
+        self.nodes = 0  # Search nodes expanded
+        self.optimal = False  # Whether the last run finished within its budget
+        self.elapsed = 0.0
+        self.shared = None  # Best satisfaction of all parallel branches, when searching one
+        self.floor = 0  # Last value read from shared
+        self.ceiling = float("inf")  # Satisfaction that ends the search once reached
+
+    def __getstate__(self):
+        # Branches are sent to workers without the travel table, which only
+        # the coordinating process needs to expand routes into paths
+        state = self.__dict__.copy()
+        state["travel"] = None
+        state["shared"] = None
+        return state
+
+    def reset(self):
+        """Clear the partial route and memo left by a search that stopped early."""
+        self.visited = [False] * len(self.stations)
+        self.visited[0] = True
+        self.route = [0]
+        self.mask = 1
+        self.seen = {}
+
+    def restart(self, time_limit, ceiling=float("inf")):
+        """Prepare another search from the same start.
+
+        The search stops as soon as a route reaches ceiling, a satisfaction
+        already known to be the most any route can have.
+        """
+        self.reset()
+        self.time_limit = time_limit
+        self.ceiling = ceiling
+        self.floor = 0
+        self.best_satisfaction = 0
+        self.best_route = []
+        self.nodes = 0
+
+    def route_time(self, route):
+        """Minutes a route of condensed nodes takes, visits included."""
+        return sum(self.cost[u][v] for u, v in zip(route, route[1:]))
+
+    def bound(self, current, time_left):
+        """Upper bound on the satisfaction still to be gained, including the return to start."""
+        total = self.satisfaction[0]
+        budget = time_left - self.arrival_cost[0]  # Time left for stations before returning
+        cost_from = self.cost[current]
+        for v in self.candidates:
+            if budget <= 0:
+                break
+            if self.visited[v] or cost_from[v] + self.return_time[v] > time_left + TIME_EPSILON:
+                continue
+            cost = self.arrival_cost[v]
+            if cost <= budget:
+                total += self.satisfaction[v]
+                budget -= cost
+            else:
+                total += self.satisfaction[v] * budget / cost
+                break
+        return total
+
+    def run(self, max_nodes=None, deadline=None, pool=None):
+        """Return (satisfaction, visits, path) for the best route found, as station ids.
+
+        Stops early after max_nodes nodes or past the time.monotonic() deadline;
+        `optimal` then tells whether the result is still proven best.
+        Long searches are split across pool when one is given.
+        """
+        started = time.monotonic()
+        if pool is None:
+            self.optimal = self.search(max_nodes, deadline)
+        else:
+            self.optimal = self.search_parallel(pool, max_nodes, deadline)
+        self.elapsed = time.monotonic() - started
+        if not self.best_route:
+            return 0, [], []
+
+        visits = [self.stations[node] for node in self.best_route]
+        path = [visits[0]]
+        for a, b in zip(visits, visits[1:]):
+            path.extend(travel_path(self.travel, a, b))
+        return self.best_satisfaction, visits, path
+
+    def enter(self, current, time_left, current_satisfaction):
+        """Count a search node; returns False when it cannot lead to a better route."""
+        self.nodes += 1
+        reach = current_satisfaction + self.bound(current, time_left)
+        # Routes only as good as another branch's best are still searched, so
+        # ties resolve to the same route as a sequential search
+        if reach <= self.best_satisfaction or reach < self.floor:
+            return False
+
+        # Returning to the start closes a route; keep it if it is the best so far
+        if current and time_left >= self.return_time[current]:
+            if current_satisfaction + self.satisfaction[0] > self.best_satisfaction:
+                self.best_satisfaction = current_satisfaction + self.satisfaction[0]
+                self.best_route = self.route + [0]
+                # Unlocked, so a racing branch can overwrite a higher value;
+                # that only costs some pruning until the next improvement
+                if self.shared is not None and self.best_satisfaction > self.shared[0]:
+                    self.shared[0] = self.best_satisfaction
+        return True
+
+    def search(self, max_nodes=None, deadline=None, first_moves=None):
+        """Depth-first search with an explicit stack; returns False if it ran out of budget.
+
+        first_moves restricts the moves out of start, e.g. to one branch.
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            return False  # Branches queued behind others can start after the deadline
+        if self.time_limit < self.arrival_cost[0] or not self.enter(0, self.time_limit, 0):
+            return True
+
+        # One frame per stop on the route: [node, time left, satisfaction, moves, next move to try]
+        stack = [[0, self.time_limit, 0, self.moves[0] if first_moves is None else first_moves, 0]]
+        while stack:
+            frame = stack[-1]
+            current, time_left, current_satisfaction, moves, index = frame
+            if index == len(moves):
+                # Backtrack
+                stack.pop()
+                if stack:
+                    self.visited[current] = False
+                    self.route.pop()
+                    self.mask ^= 1 << current
+                continue
+            frame[4] = index + 1
+
+            # Skip stations already on the route, or from which start is out of reach
+            next_node, total_time = moves[index]
+            remaining = time_left - total_time
+            if self.visited[next_node] or remaining + TIME_EPSILON < self.return_time[next_node]:
+                continue
+
+            # Skip orders of the same stations that were already tried with more time left
+            mask = self.mask | 1 << next_node
+            key = (mask, next_node)
+            if self.seen.get(key, -1) >= remaining:
+                continue
+
+            if max_nodes is not None and self.nodes >= max_nodes:
+                return False
+            if self.nodes % DEADLINE_CHECK_INTERVAL == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    return False
+                if self.shared is not None:
+                    self.floor = self.shared[0]
+            if len(self.seen) < MAX_SEEN_STATES:
+                self.seen[key] = remaining
+
+            self.visited[next_node] = True
+            self.route.append(next_node)
+            self.mask = mask
+            next_satisfaction = current_satisfaction + self.satisfaction[next_node]
+            if self.enter(next_node, remaining, next_satisfaction):
+                if self.best_satisfaction >= self.ceiling:
+                    return True
+                stack.append([next_node, remaining, next_satisfaction, self.moves[next_node], 0])
+            else:
+                self.visited[next_node] = False
+                self.route.pop()
+                self.mask = mask ^ 1 << next_node
+        return True
+
+    def search_parallel(self, pool, max_nodes=None, deadline=None):
+        """Search one branch per first stop on pool; returns False if any ran out of budget.
+
+        A short sequential search runs first: it settles small problems
+        without the pool and gives the branches a route to beat.
+        """
+        probe_nodes = PARALLEL_AFTER_NODES if max_nodes is None else min(max_nodes, PARALLEL_AFTER_NODES)
+        if self.search(probe_nodes, deadline):
+            return True
+        if self.nodes >= (max_nodes or float("inf")) or (deadline is not None and time.monotonic() > deadline):
+            return False
+
+        self.reset()
+        branches = len(self.moves[0])
+        branch_nodes = None if max_nodes is None else max(1, (max_nodes - self.nodes) // branches)
+        # Shared file layout: the best satisfaction as a float64, then the pickled search
+        payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, path = tempfile.mkstemp(prefix="tourist-", suffix=".search", dir=SHARED_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(np.float64(self.best_satisfaction).tobytes())
+                f.write(payload)
+            # The deadline is comparable across processes: time.monotonic() is system-wide
+            jobs = [(path, branch, branch_nodes, deadline) for branch in range(branches)]
+            results = list(pool.map(search_branch, jobs))
+        finally:
+            os.remove(path)
+
+        # Branches are merged in move order and the probe's route wins ties,
+        # which picks the route a sequential search would have returned
+        optimal = True
+        for satisfaction, route, nodes, finished in results:
+            self.nodes += nodes
+            optimal = optimal and finished
+            if satisfaction > self.best_satisfaction:
+                self.best_satisfaction = satisfaction
+                self.best_route = route
+        return optimal
+
+# (shared file path, search) last unpickled by this worker, which usually
+# runs several branches of the same search in a row
+_branch_search = (None, None)
+
+def search_branch(job):
+    """Run one first-stop branch of a RouteSearch; runs inside pool workers."""
+    global _branch_search
+    path, branch, max_nodes, deadline = job
+    shared = np.memmap(path, dtype=np.uint8, mode="r+")  # Writes are seen by every process mapping it
+    name, search = _branch_search
+    if name != path:
+        search = pickle.loads(shared[8:])
+        _branch_search = (path, search)
+
+    search.reset()
+    search.shared = shared[:8].view(np.float64)
+    search.floor = float(search.shared[0])
+    search.best_satisfaction = 0
+    search.best_route = []
+    search.nodes = 0
+    try:
+        finished = search.search(max_nodes, deadline, [search.moves[0][branch]])
+        return search.best_satisfaction, search.best_route, search.nodes, finished
+    finally:
+        search.shared = None  # Unmaps the file once nothing else refers to it
+
+def location_values(network, locations):
+    """Per-id satisfaction and minimum visit time lists for a request's locations."""
+    satisfaction = [0] * len(network.names)
+    min_time = [None] * len(network.names)
+    for name, (value, minutes) in locations.items():
+        station = network.ids.get(name)
+        if station is not None:
+            satisfaction[station] = value
+            min_time[station] = minutes
+    return satisfaction, min_time
+
+def answer_queries(network, travel, locations, queries, max_nodes=None, time_budget=TIME_BUDGET, pool=None):
+    """Best routes for several (start, time limit) queries over the same locations.
+
+    Larger limits are searched first and bound or answer the smaller ones.
+    Returns one (result, optimal, nodes, elapsed) tuple per query, with result
+    as returned by RouteSearch.run.
+    """
+    satisfaction, min_time = location_values(network, locations)
+    answers = [None] * len(queries)
+    by_start = {}
+    for index, (start, time_limit) in enumerate(queries):
+        by_start.setdefault(start, []).append(index)
+
+    for start, indexes in by_start.items():
+        search = RouteSearch(network, travel, satisfaction, min_time, start, 0)
+        larger = None  # (time limit, answer, route time) of the last query searched
+        for index in sorted(indexes, key=lambda index: queries[index][1], reverse=True):
+            time_limit = queries[index][1]
+            ceiling = float("inf")
+            if larger is not None:
+                larger_limit, (result, optimal, _, _), route_time = larger
+                if larger_limit == time_limit:
+                    answers[index] = larger[1]
+                    continue
+                if optimal:
+                    if route_time <= time_limit + TIME_EPSILON:
+                        answers[index] = (result, True, 0, 0.0)
+                        continue
+                    ceiling = result[0]
+
+            search.restart(time_limit, ceiling)
+            result = search.run(max_nodes, time.monotonic() + time_budget, pool)
+            answers[index] = (result, search.optimal, search.nodes, search.elapsed)
+            larger = (time_limit, answers[index], search.route_time(search.best_route))
+    return answers
+
+def route_json(network, result, optimal, nodes, elapsed):
+    best_satisfaction, visits, path = result
+    # The best path (every station passed) and satisfaction, and where the route stops.
+    # optimal is false when the budget ran out first and a better route may exist.
+    return {
+        'satisfaction': best_satisfaction,
+        'path': [network.names[station] for station in path],
+        'visits': [network.names[station] for station in visits],
+        'optimal': optimal,
+        'nodes': nodes,
+        'elapsedMs': round(elapsed * 1000, 3),
+    }
+
+def read_budgets(data):
+    """Optional search budgets from a request body: (max_nodes, time_budget) or an error message."""
+    time_budget = data.get('timeBudget', TIME_BUDGET)
+    max_nodes = data.get('maxNodes')
+    if not is_positive(time_budget) or (max_nodes is not None and not is_positive(max_nodes)):
+        return None, None, "timeBudget and maxNodes must be positive numbers"
+    return max_nodes, time_budget, None
+
+def tourist_pool():
+    workers = WORKERS or os.cpu_count()
+    return get_pool("tourist", workers) if workers > 1 else None
 
 @app.route('/tourist', methods=['POST'])
 def tourist_route():
@@ -157,16 +604,79 @@ def tourist_route():
 
         if not locations or not starting_point or time_limit is None:
             return jsonify({"error": "Invalid input"}), 400
+        if starting_point not in NETWORK.ids:
+            return jsonify({"error": f"Unknown station {starting_point}"}), 400
+        if not is_positive(time_limit):
+            return jsonify({"error": "timeLimit must be a positive number"}), 400
 
-        # Initialize variables for DFS search
-        best_result = {'satisfaction': 0, 'path': []}
-        visited = set([starting_point])
-        
-        dfs(locations, train_lines, travel_times, starting_point, time_limit, 0, [starting_point], visited, starting_point, best_result)
+        # Optional search budgets: seconds of wall-clock time and search nodes
+        max_nodes, time_budget, error = read_budgets(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Return the best path and satisfaction
-        return jsonify(best_result)
+        satisfaction, min_time = location_values(NETWORK, locations)
+        search = RouteSearch(NETWORK, TRAVEL, satisfaction, min_time, NETWORK.ids[starting_point], time_limit)
+        pool = tourist_pool()
+        try:
+            result = search.run(max_nodes, time.monotonic() + time_budget, pool)
+        except Exception as e:
+            logger.error(f"Error in /tourist: {e}")
+            if pool is not None:
+                reset_pool("tourist")
+            return jsonify({"error": str(e)}), 500
+
+        return jsonify(route_json(NETWORK, result, search.optimal, search.nodes, search.elapsed))
 
     except Exception as e:
         logger.error(f"Error in /tourist: {e}")
         return jsonify({"error": str(e)}), 500
+
+@app.route('/tourist/batch', methods=['POST'])
+def tourist_batch():
+    """Answer several {"startingPoint", "timeLimit"} queries over one locations map.
+
+    Results come back in query order, each shaped like a /tourist response or
+    an {"error"} for a query that could not be answered. Budgets apply per query.
+    """
+    try:
+        data = request.json
+        locations = data.get('locations')
+        queries = data.get('queries')
+
+        if not locations or not isinstance(queries, list) or not all(isinstance(query, dict) for query in queries):
+            return jsonify({"error": "locations and a list of queries are required"}), 400
+        max_nodes, time_budget, error = read_budgets(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        errors = {}
+        valid = []  # (index, (start id, time limit))
+        for index, query in enumerate(queries):
+            starting_point = query.get('startingPoint')
+            time_limit = query.get('timeLimit')
+            if not starting_point or not isinstance(starting_point, str) or time_limit is None:
+                errors[index] = "Invalid input"
+            elif starting_point not in NETWORK.ids:
+                errors[index] = f"Unknown station {starting_point}"
+            elif not is_positive(time_limit):
+                errors[index] = "timeLimit must be a positive number"
+            else:
+                valid.append((index, (NETWORK.ids[starting_point], time_limit)))
+
+        pool = tourist_pool()
+        try:
+            answers = answer_queries(NETWORK, TRAVEL, locations, [query for _, query in valid], max_nodes, time_budget, pool)
+        except Exception as e:
+            logger.error(f"Error in /tourist/batch: {e}")
+            if pool is not None:
+                reset_pool("tourist")
+            return jsonify({"error": str(e)}), 500
+
+        results = [{"error": errors.get(index)} for index in range(len(queries))]
+        for (index, _), answer in zip(valid, answers):
+            results[index] = route_json(NETWORK, *answer)
+        return jsonify({"results": results})
+
+    except Exception as e:
+        logger.error(f"Error in /tourist/batch: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,3 @@
+def is_positive(value):
+    """Whether a JSON request value is a positive number; booleans do not count."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
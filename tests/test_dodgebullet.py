@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from routes.dodgebullet import dodge_bullets, move_bullets, move_directions, opp_bullet, parse_map
+
+def reference_dodge(grid, player_pos, bullets, instructions):
+    """The original recursive search, which tries every path without a visited set."""
+    if not bullets:
+        return instructions
+
+    for dr, dc, move in move_directions:
+        new_r = player_pos[0] + dr
+        new_c = player_pos[1] + dc
+        if not (0 <= new_r < len(grid) and 0 <= new_c < len(grid[0])):
+            continue
+        if any(new_r == br and new_c == bc and opp_bullet[move] == d for br, bc, d in bullets):
+            continue
+        next_bullets = move_bullets(bullets, grid)
+        # Bullets that leave the grid can never land on the player
+        if any((new_r, new_c) == (br, bc) for br, bc, _ in next_bullets):
+            continue
+        result = reference_dodge(grid, (new_r, new_c), next_bullets, instructions + [move])
+        if result:
+            return result
+    return None
+
+def random_map(rng):
+    rows, cols = rng.randint(1, 5), rng.randint(1, 5)
+    cells = [(r, c) for r in range(rows) for c in range(cols)]
+    rng.shuffle(cells)
+    grid = [["."] * cols for _ in range(rows)]
+    player, *bullets = cells[:rng.randint(1, min(5, len(cells)))]
+    grid[player[0]][player[1]] = "*"
+    for r, c in bullets:
+        grid[r][c] = rng.choice("udrl")
+    return "\n".join("".join(row) for row in grid)
+
+@pytest.mark.parametrize("seed", range(500))
+def test_matches_recursive_search(seed):
+    map_str = random_map(random.Random(seed))
+    grid, player_pos, bullets = parse_map(map_str)
+    assert dodge_bullets(grid, player_pos, bullets) == reference_dodge(grid, player_pos, bullets, [])
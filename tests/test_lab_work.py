@@ -0,0 +1,81 @@
+from collections import defaultdict, deque
+
+import pytest
+
+from routes.checkpoints import CheckpointCache
+from routes.lab_work import parse_markdown_table, simulate_lab_work
+
+HEADER = "| Lab | Cell Counts | Increment | Condition |\n|-----|-------------|-----------|-----------|\n"
+
+TABLES = [
+    # Squaring, which is what made exact counts grow without bound
+    HEADER + "| 0 | 56 79 | count * count | 13 1 3 |\n"
+             "| 1 | 98 | count + 6 | 7 2 0 |\n"
+             "| 2 | 65 70 95 | count * 5 | 2 3 1 |\n"
+             "| 3 | 2 | count + 3 | 19 2 0 |",
+    HEADER + "| 0 | 3 | count * count | 5 1 0 |\n"
+             "| 1 | 7 11 | count + 1 | 3 0 1 |",
+    HEADER + "| 4 | 10 20 30 | count * 3 | 4 7 4 |\n"
+             "| 7 | 1 | count + 5 | 9 4 7 |\n"
+             "| 9 |  | count | 2 4 9 |",
+    HEADER + "| 1 | 42 | count + 11 | 23 1 1 |",
+]
+
+def reference_lab_work(table, total_days, interval):
+    """The original day loop on exact Python ints, without reduction or cycle detection."""
+    rules = {
+        "count * count": lambda count: count * count,
+        "count": lambda count: count,
+    }
+    labs = {}
+    for line in table.strip().split("\n")[2:]:
+        parts = [part.strip() for part in line.strip().split("|")]
+        rule = parts[3]
+        if rule not in rules:
+            operator, value = rule.split()[1], int(rule.split()[2])
+            rules[rule] = (lambda k: lambda count: count * k)(value) if operator == "*" else \
+                          (lambda k: lambda count: count + k)(value)
+        labs[int(parts[1])] = (deque(map(int, parts[2].split())), rules[rule], list(map(int, parts[4].split())))
+
+    keys = sorted(labs)
+    analysis_count = defaultdict(int)
+    result = {}
+    for day in range(1, total_days + 1):
+        for key in keys:
+            cells, rule, (div, if_true, if_false) = labs[key]
+            passed = []
+            while cells:
+                new_cell = rule(cells.popleft())
+                passed.append((if_true if new_cell % div == 0 else if_false, new_cell))
+                analysis_count[key] += 1
+            # Dishes reach their labs before the next lab runs, as in the original
+            for target, new_cell in passed:
+                labs[target][0].append(new_cell)
+        if day % interval == 0:
+            result[day] = [analysis_count[key] for key in keys]
+    return result
+
+@pytest.mark.parametrize("table", TABLES)
+def test_matches_exact_simulation(table):
+    # Squared counts double in length every day, so the exact version stays short
+    total_days = 12 if "count * count" in table else 300
+    expected = reference_lab_work(table, total_days, 3)
+    assert simulate_lab_work(parse_markdown_table(table), total_days, 3) == expected
+
+@pytest.mark.parametrize("table", TABLES)
+def test_long_horizon_is_consistent(table):
+    # Past the cycle, extrapolated intervals match a run that stops earlier
+    labs = parse_markdown_table(table)
+    long_run = simulate_lab_work(labs, 10000, 100)
+    short_run = simulate_lab_work(labs, 2000, 100)
+    assert {day: counts for day, counts in long_run.items() if day <= 2000} == short_run
+    assert len(long_run) == 100
+
+def test_resumes_from_checkpoint():
+    table = TABLES[0]
+    cache = CheckpointCache(64 * 1024 * 1024)
+    first = simulate_lab_work(parse_markdown_table(table), 6, 2, cache)
+    second = simulate_lab_work(parse_markdown_table(table), 12, 2, cache)
+    assert first == reference_lab_work(table, 6, 2)
+    assert second == reference_lab_work(table, 12, 2)
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,84 @@
+import random
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import routes.tourist as tourist
+from routes.tourist import NETWORK, TRAVEL, RouteSearch, location_values
+
+def random_locations(rng, count):
+    """Locations at a station and its nearest neighbours, so routes can visit several of them."""
+    start = rng.randrange(len(NETWORK.names))
+    nearest = sorted(range(len(NETWORK.names)), key=lambda station: TRAVEL.times[start, station])[:count]
+    locations = {
+        NETWORK.names[station]: [rng.randint(1, 20), rng.randint(1, 15)]
+        for station in nearest
+    }
+    return locations, start
+
+def reference_best(locations, start, time_limit):
+    """Best satisfaction over every order of every subset of stations, by exhaustive search."""
+    satisfaction, min_time = location_values(NETWORK, locations)
+    times = TRAVEL.times.tolist()
+    stations = [
+        station for station in range(len(NETWORK.names))
+        if station != start and min_time[station] is not None and satisfaction[station] > 0
+    ]
+    best = 0
+
+    def visit(current, elapsed, total, remaining):
+        nonlocal best
+        if current != start and elapsed + times[current][start] + min_time[start] <= time_limit:
+            best = max(best, total + satisfaction[start])
+        for station in remaining:
+            cost = times[current][station] + min_time[station]
+            if elapsed + cost <= time_limit:
+                visit(station, elapsed + cost, total + satisfaction[station], remaining - {station})
+
+    visit(start, 0, 0, frozenset(stations))
+    return best
+
+def route_time(locations, visits):
+    _, min_time = location_values(NETWORK, locations)
+    return sum(TRAVEL.times[a, b] + min_time[b] for a, b in zip(visits, visits[1:]))
+
+@pytest.mark.parametrize("seed", range(100))
+def test_matches_exhaustive_search(seed):
+    rng = random.Random(seed)
+    locations, start = random_locations(rng, 10)
+    # Mostly too short to visit every station, so the bound has to choose
+    time_limit = rng.randint(10, 80)
+    satisfaction, min_time = location_values(NETWORK, locations)
+
+    search = RouteSearch(NETWORK, TRAVEL, satisfaction, min_time, start, time_limit)
+    best, visits, path = search.run()
+    assert search.optimal
+    assert best == reference_best(locations, start, time_limit)
+    if visits:
+        assert visits[0] == visits[-1] == start
+        assert len(set(visits[1:-1])) == len(visits) - 2
+        assert route_time(locations, visits) <= time_limit
+        assert sum(satisfaction[station] for station in visits[1:]) == best
+        assert path[0] == path[-1] == start
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+@pytest.mark.parametrize("seed", range(8))
+def test_parallel_matches_sequential(seed, pool, monkeypatch):
+    monkeypatch.setattr(tourist, "PARALLEL_AFTER_NODES", 10)
+    rng = random.Random(seed)
+    locations, start = random_locations(rng, 12)
+    time_limit = rng.randint(40, 120)
+    satisfaction, min_time = location_values(NETWORK, locations)
+
+    sequential = RouteSearch(NETWORK, TRAVEL, satisfaction, min_time, start, time_limit)
+    expected = sequential.run()
+    assert sequential.nodes > tourist.PARALLEL_AFTER_NODES  # So the pool is really used
+
+    parallel = RouteSearch(NETWORK, TRAVEL, satisfaction, min_time, start, time_limit)
+    assert parallel.run(pool=pool) == expected
+    assert parallel.optimal